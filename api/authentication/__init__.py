@@ -1,5 +1,9 @@
 from api.authentication.basic_token_authentication import BasicTokenAuthentication
+from api.authentication.tracker_signature_authentication import (
+    TrackerSignatureAuthentication,
+)
 
 __all__ = [
     "BasicTokenAuthentication",
+    "TrackerSignatureAuthentication",
 ]
@@ -0,0 +1,74 @@
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from bikesharing.tracker_lookup import lookup_trackers
+from cykel.cache import is_shared
+
+
+class TrackerSignatureAuthentication(BaseAuthentication):
+    """Authentication of trackers by a HMAC-SHA256 signature of the request.
+
+    The header is `Authorization: HMAC <device_id>:<timestamp>:<signature>`,
+    where the signature is the hex digest of `<timestamp>.<body>` with the
+    hmac_secret of the tracker as key, and the timestamp is in unix
+    seconds. Every signature is accepted once, within
+    TRACKER_SIGNATURE_MAX_AGE seconds of the timestamp.
+
+    The used signatures are remembered in the django cache. Only a cache
+    shared by all processes (see cykel.cache) sees a signature replayed
+    to another process, so signatures are rejected without one.
+
+    The authenticated tracker is `request.auth`, the user is anonymous.
+    """
+
+    keyword = "HMAC"
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_("Invalid signature header."))
+        if not is_shared():
+            raise exceptions.AuthenticationFailed(
+                _("Signatures are not accepted without a shared cache.")
+            )
+        try:
+            # device ids may contain colons, e.g. mac addresses
+            device_id, timestamp, signature = auth[1].decode().rsplit(":", 2)
+            signed_at = int(timestamp)
+        except (UnicodeError, ValueError):
+            raise exceptions.AuthenticationFailed(_("Invalid signature header."))
+
+        max_age = settings.TRACKER_SIGNATURE_MAX_AGE
+        if abs(time.time() - signed_at) > max_age:
+            raise exceptions.AuthenticationFailed(_("Signature expired."))
+
+        tracker = lookup_trackers([device_id]).get(device_id)
+        if tracker is None or not tracker.hmac_secret:
+            raise exceptions.AuthenticationFailed(_("Invalid signature."))
+        expected = hmac.new(
+            tracker.hmac_secret.encode(),
+            timestamp.encode() + b"." + request.body,
+            hashlib.sha256,
+        ).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            raise exceptions.AuthenticationFailed(_("Invalid signature."))
+
+        # signatures older than max_age are rejected above
+        replay_key = "tracker_signature:{}".format(signature)
+        if not cache.add(replay_key, True, timeout=2 * max_age + 1):
+            raise exceptions.AuthenticationFailed(_("Signature already used."))
+
+        return (AnonymousUser(), tracker)
+
+    def authenticate_header(self, request):
+        return self.keyword
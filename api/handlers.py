@@ -0,0 +1,13 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from rest_framework_api_key.models import APIKey
+
+from .permissions import api_key_cache_key
+
+
+def forget_api_key(sender, instance, **kwargs):
+    cache.delete(api_key_cache_key(instance.prefix))
+
+
+post_save.connect(forget_api_key, sender=APIKey)
+post_delete.connect(forget_api_key, sender=APIKey)
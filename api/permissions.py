@@ -0,0 +1,60 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+from rest_framework.permissions import BasePermission
+from rest_framework_api_key.permissions import HasAPIKey
+
+from bikesharing.models import LocationTracker
+
+
+def api_key_cache_key(prefix):
+    return "api_key:{}".format(prefix)
+
+
+class CachedHasAPIKey(HasAPIKey):
+    """HasAPIKey, which remembers verified keys for API_KEY_CACHE_TIMEOUT
+    seconds.
+
+    Verifying a key against its hash is slow on purpose. Instead, the
+    sha256 digest of a verified key is cached by its prefix, so the key
+    is only verified again once the entry expires, or the api key is
+    changed or deleted (see api.handlers).
+    """
+
+    def has_permission(self, request, view):
+        key = self.get_key(request)
+        if not key:
+            return False
+
+        prefix, _, _ = key.partition(".")
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        cached = cache.get(api_key_cache_key(prefix))
+        if cached is not None and hmac.compare_digest(cached, digest):
+            return True
+
+        try:
+            api_key = self.model.objects.get_usable_keys().get(prefix=prefix)
+        except self.model.DoesNotExist:
+            return False
+        if not api_key.is_valid(key) or api_key.has_expired:
+            return False
+
+        timeout = settings.API_KEY_CACHE_TIMEOUT
+        if api_key.expiry_date is not None:
+            # don't remember the key beyond its expiry
+            remaining = (api_key.expiry_date - now()).total_seconds()
+            timeout = min(timeout, int(remaining))
+        if timeout > 0:
+            cache.set(api_key_cache_key(prefix), digest, timeout=timeout)
+        return True
+
+
+class IsSignedTracker(BasePermission):
+    """The request is signed by a tracker, see
+    TrackerSignatureAuthentication."""
+
+    def has_permission(self, request, view):
+        return isinstance(request.auth, LocationTracker)
@@ -1,7 +1,7 @@
 from allauth.socialaccount.models import SocialApp
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
-from django.utils.timezone import now, timedelta
+from django.utils.timezone import now
 from rest_framework import serializers
 
 from bikesharing.models import (
@@ -14,7 +14,6 @@ from bikesharing.models import (
     Rent,
     Station,
 )
-from cykel.models import CykelLogEntry
 from cykel.serializers import MappedChoiceField
 
 
@@ -151,46 +150,6 @@ class LocationTrackerUpdateSerializer(serializers.ModelSerializer):
     lng = serializers.CharField(required=False)
     accuracy = serializers.CharField(required=False)
 
-    def save(self):
-        self.instance.last_reported = now()
-        super().save()
-
-        if (
-            self.instance.tracker_status == LocationTracker.Status.ACTIVE
-            and self.instance.battery_voltage is not None
-            and self.instance.tracker_type is not None
-        ):
-            data = {"voltage": self.instance.battery_voltage}
-            action_type = None
-            action_type_prefix = "cykel.tracker"
-
-            if self.instance.bike:
-                data["bike_id"] = self.instance.bike.pk
-                action_type_prefix = "cykel.bike.tracker"
-
-            if (
-                self.instance.tracker_type.battery_voltage_critical is not None
-                and self.instance.battery_voltage
-                <= self.instance.tracker_type.battery_voltage_critical
-            ):
-                action_type = "battery.critical"
-            elif (
-                self.instance.tracker_type.battery_voltage_warning is not None
-                and self.instance.battery_voltage
-                <= self.instance.tracker_type.battery_voltage_warning
-            ):
-                action_type = "battery.warning"
-
-            if action_type is not None:
-                action_type = "{}.{}".format(action_type_prefix, action_type)
-                somehoursago = now() - timedelta(hours=48)
-                CykelLogEntry.create_unless_time(
-                    somehoursago,
-                    content_object=self.instance,
-                    action_type=action_type,
-                    data=data,
-                )
-
     def validate(self, data):
         if (data.get("lat") is None and data.get("lng") is not None) or (
             data.get("lat") is not None and data.get("lng") is None
@@ -275,7 +234,7 @@ class MaintenanceTrackerSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         current_location = instance.current_geolocation()
         if current_location:
-            representation["last_location_reported"] = current_location.reported_at
+            representation["last_location_reported"] = current_location.last_seen()
             current_geolocation = current_location.geo
             if current_geolocation and current_geolocation.x and current_geolocation.y:
                 representation["lat"] = current_geolocation.y
@@ -8,6 +8,7 @@ from .views import (
     RentViewSet,
     UserDetailsView,
     updatebikelocation,
+    updatebikelocations,
 )
 
 router = routers.DefaultRouter(trailing_slash=False)
@@ -17,6 +18,7 @@ router.register(r"maintenance", MaintenanceViewSet, basename="maintenance")
 urlpatterns = [
     re_path(r"^", include(router.urls)),
     path("bike/updatelocation", updatebikelocation),
+    path("bike/updatelocations", updatebikelocations),
     path("user", UserDetailsView.as_view()),
     path("config/loginproviders", LoginProviderViewSet.as_view({"get": "list"})),
     path("auth/token", views.obtain_auth_token),
@@ -1,13 +1,18 @@
+import base64
+from datetime import datetime
+
 from allauth.socialaccount.models import SocialApp
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import D
 from django.contrib.sites.shortcuts import get_current_site
 from django.contrib.syndication.views import Feed
-from django.core.paginator import Paginator
+from django.db.models import Prefetch, Q
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
 from django.utils.feedgenerator import Rss201rev2Feed
-from django.utils.timezone import now, timedelta
+from django.utils.timezone import is_naive, make_aware, now
 from preferences import preferences
 from rest_framework import exceptions, generics, mixins, status, viewsets
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
@@ -25,12 +30,15 @@ from rest_framework.permissions import (
 )
 from rest_framework.response import Response
 from rest_framework.views import exception_handler
-from rest_framework_api_key.permissions import HasAPIKey
 
+from bikesharing.ingest import apply_reports
 from bikesharing.models import Bike, Location, LocationTracker, Rent, Station
+from bikesharing.report_queue import enqueue_reports
+from bikesharing.tracker_lookup import lookup_trackers
 from cykel.models import CykelLogEntry
 
-from .authentication import BasicTokenAuthentication
+from .authentication import BasicTokenAuthentication, TrackerSignatureAuthentication
+from .permissions import CachedHasAPIKey, IsSignedTracker
 from .serializers import (
     BikeSerializer,
     CreateRentSerializer,
@@ -42,6 +50,9 @@ from .serializers import (
     UserDetailsSerializer,
 )
 
+# maximum number of reports accepted by updatebikelocations at once
+MAX_REPORTS = 1000
+
 
 class BikeViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Bike.objects.all()
@@ -176,83 +187,110 @@ class RentViewSet(
 
 
 @api_view(["POST"])
-@permission_classes([HasAPIKey])
+@authentication_classes([TrackerSignatureAuthentication])
+@permission_classes([CachedHasAPIKey | IsSignedTracker])
 def updatebikelocation(request):
     device_id = request.data.get("device_id")
     if not (device_id):
         return Response({"error": "device_id missing"}, status=400)
-    try:
-        tracker = LocationTracker.objects.get(device_id=device_id)
-    except LocationTracker.DoesNotExist:
+    if not signed_by(request, device_id):
+        return Response({"error": "signed by another tracker"}, status=403)
+
+    if settings.TRACKER_INGEST_ASYNC:
+        # the tracker is looked up when the report is applied
+        serializer = LocationTrackerUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        enqueue_reports([serializer.validated_data])
+        return Response({"success": True}, status=202)
+
+    tracker = lookup_trackers([device_id]).get(str(device_id))
+    if tracker is None:
         return Response({"error": "tracker does not exist"}, status=404)
 
     serializer = LocationTrackerUpdateSerializer(tracker, data=request.data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=400)
 
-    serializer.save()
+    (result,) = apply_reports([(tracker, serializer.validated_data)])
+    return Response(result)
 
-    lat = request.data.get("lat")
-    lng = request.data.get("lng")
-    accuracy = request.data.get("accuracy")
-    loc = None
 
-    if lat and lng:
-        loc = Location(
-            source=Location.Source.TRACKER,
-            reported_at=now(),
-            tracker=tracker,
-            geo=Point(float(lng), float(lat), srid=4326),
-        )
-        if tracker.bike:
-            loc.bike = tracker.bike
-        if accuracy:
-            loc.accuracy = accuracy
-        loc.save()
-
-    if tracker.bike:
-        bike = tracker.bike
-        bike.last_reported = now()
-
-        if loc and not loc.internal:
-            # check if bike is near station and assign it to that station
-            # distance ist configured in prefernces
-            max_distance = preferences.BikeSharePreferences.station_match_max_distance
-            station_closer_than_Xm = Station.objects.filter(
-                location__distance_lte=(loc.geo, D(m=max_distance)),
-                status=Station.Status.ACTIVE,
-            ).first()
-            if station_closer_than_Xm:
-                bike.current_station = station_closer_than_Xm
-            else:
-                bike.current_station = None
-
-        bike.save()
-
-    someminutesago = now() - timedelta(minutes=15)
-    data = {}
-    if loc:
-        data = {"location_id": loc.id}
-
-    if tracker.tracker_status == LocationTracker.Status.MISSING:
-        action_type = "cykel.tracker.missing_reporting"
-        CykelLogEntry.create_unless_time(
-            someminutesago, content_object=tracker, action_type=action_type, data=data
-        )
+@api_view(["POST"])
+@authentication_classes([TrackerSignatureAuthentication])
+@permission_classes([CachedHasAPIKey | IsSignedTracker])
+def updatebikelocations(request):
+    """apply a list of tracker reports, as accepted by updatebikelocation.
 
-    if tracker.bike and tracker.bike.state == Bike.State.MISSING:
-        action_type = "cykel.bike.missing_reporting"
-        CykelLogEntry.create_unless_time(
-            someminutesago,
-            content_object=tracker.bike,
-            action_type=action_type,
-            data=data,
+    Responds with a list of results, one for every report.
+    """
+    if not isinstance(request.data, list):
+        return Response({"error": "list of reports expected"}, status=400)
+    if len(request.data) > MAX_REPORTS:
+        return Response(
+            {"error": "at most {} reports allowed".format(MAX_REPORTS)}, status=400
         )
 
-    if not loc:
-        return Response({"success": True, "warning": "lat/lng missing"})
-
-    return Response({"success": True})
+    if settings.TRACKER_INGEST_ASYNC:
+        return queue_reports(request)
+
+    device_ids = [
+        report.get("device_id") for report in request.data if isinstance(report, dict)
+    ]
+    trackers = lookup_trackers(device_id for device_id in device_ids if device_id)
+
+    results = [None] * len(request.data)
+    reports = []
+    indexes = []
+    for index, report in enumerate(request.data):
+        if not isinstance(report, dict) or not report.get("device_id"):
+            results[index] = {"error": "device_id missing"}
+            continue
+        if not signed_by(request, report["device_id"]):
+            results[index] = {"error": "signed by another tracker"}
+            continue
+        tracker = trackers.get(str(report["device_id"]))
+        if tracker is None:
+            results[index] = {"error": "tracker does not exist"}
+            continue
+        serializer = LocationTrackerUpdateSerializer(tracker, data=report)
+        if not serializer.is_valid():
+            results[index] = {"error": serializer.errors}
+            continue
+        reports.append((tracker, serializer.validated_data))
+        indexes.append(index)
+
+    for index, result in zip(indexes, apply_reports(reports)):
+        results[index] = result
+    return Response(results)
+
+
+def queue_reports(request):
+    results = []
+    reports = []
+    for report in request.data:
+        if not isinstance(report, dict) or not report.get("device_id"):
+            results.append({"error": "device_id missing"})
+            continue
+        if not signed_by(request, report["device_id"]):
+            results.append({"error": "signed by another tracker"})
+            continue
+        serializer = LocationTrackerUpdateSerializer(data=report)
+        if not serializer.is_valid():
+            results.append({"error": serializer.errors})
+            continue
+        reports.append(serializer.validated_data)
+        results.append({"success": True})
+    enqueue_reports(reports)
+    return Response(results, status=202)
+
+
+def signed_by(request, device_id):
+    """return whether the request is signed by the tracker with `device_id`,
+    or not signed by a tracker at all."""
+    if not isinstance(request.auth, LocationTracker):
+        return True
+    return request.auth.device_id == str(device_id)
 
 
 @authentication_classes(
@@ -262,7 +300,17 @@ def updatebikelocation(request):
 class MaintenanceViewSet(viewsets.ViewSet):
     @action(detail=False, methods=["GET"])
     def mapdata(self, request):
-        bikes = Bike.objects.filter(location__isnull=False).distinct()
+        trackers = LocationTracker.objects.select_related(
+            "last_location", "tracker_type"
+        )
+        bikes = (
+            Bike.objects.filter(
+                Q(last_public_location__isnull=False)
+                | Q(last_internal_location__isnull=False)
+            )
+            .select_related("last_public_location", "lock__lock_type")
+            .prefetch_related(Prefetch("locationtracker_set", queryset=trackers))
+        )
         serializer = MaintenanceBikeSerializer(bikes, many=True)
         return Response(serializer.data)
 
@@ -271,6 +319,11 @@ class MaintenanceViewSet(viewsets.ViewSet):
         feed = LogEntryFeed()
         return feed(request)
 
+    @action(detail=False, methods=["GET"])
+    def filteredlogentryfeed(self, request):
+        feed = FilteredLogEntryFeed()
+        return feed(request)
+
 
 class UserDetailsView(generics.RetrieveAPIView):
     """Reads UserModel fields Accepts GET method.
@@ -304,52 +357,73 @@ class LoginProviderViewSet(
         return SocialApp.objects.filter(sites__id=get_current_site(self.request).id)
 
 
-class RSS20PaginatedFeed(Rss201rev2Feed):
-    def add_root_elements(self, handler):
-        super(Rss201rev2Feed, self).add_root_elements(handler)
+# entries per page of the log entry feeds
+FEED_PAGE_SIZE = 25
 
-        if self.feed["page"] > 1:
-            handler.addQuickElement(
-                "link",
-                "",
-                {
-                    "rel": "first",
-                    "href": self.feed["feed_url"],
-                },
-            )
+# query parameters of the pages of the log entry feeds
+FEED_PAGE_PARAMS = ("before", "after", "last")
 
-        if self.feed["page"] < self.feed["last_page"]:
-            handler.addQuickElement(
-                "link",
-                "",
-                {
-                    "rel": "last",
-                    "href": (f"{self.feed['feed_url']}?page={self.feed['last_page']}"),
-                },
-            )
 
-        if self.feed["page"] > 1:
-            handler.addQuickElement(
-                "link",
-                "",
-                {
-                    "rel": "previous",
-                    "href": (f"{self.feed['feed_url']}?page={self.feed['page'] - 1}"),
-                },
-            )
+def encode_cursor(entry):
+    """return the opaque position of a log entry in the feed."""
+    position = "{},{}".format(entry.timestamp.isoformat(), entry.pk)
+    return base64.urlsafe_b64encode(position.encode()).decode()
 
-        if self.feed["page"] < self.feed["last_page"]:
-            handler.addQuickElement(
-                "link",
-                "",
-                {
-                    "rel": "next",
-                    "href": (f"{self.feed['feed_url']}?page={self.feed['page'] + 1}"),
-                },
-            )
+
+def decode_cursor(cursor):
+    """return the timestamp and id of a position of encode_cursor."""
+    try:
+        position = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, pk = position.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except ValueError:
+        raise exceptions.ParseError("invalid cursor")
+
+
+def newer_than(timestamp, pk):
+    """return the condition for the entries before a position in the feed.
+
+    The redundant bound on the timestamp alone lets the database start
+    the scan of the index at the position.
+    """
+    return (Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)) & Q(
+        timestamp__gte=timestamp
+    )
+
+
+def older_than(timestamp, pk):
+    """return the condition for the entries after a position in the feed,
+    see newer_than."""
+    return (Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)) & Q(
+        timestamp__lte=timestamp
+    )
+
+
+class RSS20PaginatedFeed(Rss201rev2Feed):
+    def add_root_elements(self, handler):
+        super(Rss201rev2Feed, self).add_root_elements(handler)
+
+        for rel in ("first", "last", "previous", "next"):
+            query = self.feed["pages"].get(rel)
+            if query is None:
+                continue
+            href = self.feed["feed_url"]
+            if query:
+                href = f"{href}?{query}"
+            handler.addQuickElement("link", "", {"rel": rel, "href": href})
 
 
 class LogEntryFeed(Feed):
+    """feed of the log entries, newest first.
+
+    The pages are addressed by the position of their first or last
+    entry (keyset pagination), so no page needs to count or skip
+    entries: `?after=<cursor>` is the page of entries older than the
+    cursor, `?before=<cursor>` the one of newer entries, `?last=1` the
+    page of the oldest entries. Page numbers (`?page=<n>`) of earlier
+    versions are rejected.
+    """
+
     feed_type = RSS20PaginatedFeed
 
     def title(self):
@@ -365,21 +439,59 @@ class LogEntryFeed(Feed):
         )
 
     def get_entries(self, request):
-        return CykelLogEntry.objects.order_by("-timestamp").all()
+        return CykelLogEntry.objects.order_by("-timestamp", "-id")
 
     def get_object(self, request):
-        page = int(request.GET.get("page", 1))
+        if "page" in request.GET:
+            raise exceptions.ParseError(
+                "page numbers are not supported, follow the links of the feed"
+            )
         entries = self.get_entries(request)
-        paginator = Paginator(entries, 25)
-        return {"page": page, "paginator": paginator}
+        size = FEED_PAGE_SIZE
+        if request.GET.get("before"):
+            newer = newer_than(*decode_cursor(request.GET["before"]))
+            page = list(entries.filter(newer).reverse()[: size + 1])
+            has_newer, has_older = len(page) > size, True
+            page = page[:size][::-1]
+        elif request.GET.get("after"):
+            older = older_than(*decode_cursor(request.GET["after"]))
+            page = list(entries.filter(older)[: size + 1])
+            has_newer, has_older = True, len(page) > size
+            page = page[:size]
+        elif request.GET.get("last"):
+            page = list(entries.reverse()[: size + 1])
+            has_newer, has_older = len(page) > size, False
+            page = page[:size][::-1]
+        else:
+            page = list(entries[: size + 1])
+            has_newer, has_older = False, len(page) > size
+            page = page[:size]
+
+        pages = {}
+        if has_newer and page:
+            pages["first"] = self.page_query(request)
+            pages["previous"] = self.page_query(request, before=encode_cursor(page[0]))
+        if has_older and page:
+            pages["next"] = self.page_query(request, after=encode_cursor(page[-1]))
+            pages["last"] = self.page_query(request, last=1)
+        return {"entries": page, "pages": pages}
+
+    def page_query(self, request, **params):
+        """return the query string of a page, keeping all other parameters
+        of the request."""
+        query = request.GET.copy()
+        for param in FEED_PAGE_PARAMS:
+            query.pop(param, None)
+        for param, value in params.items():
+            query[param] = value
+        return query.urlencode()
 
     def items(self, obj):
-        return obj["paginator"].get_page(obj["page"])
+        return CykelLogEntry.prefetch_display(obj["entries"])
 
     def feed_extra_kwargs(self, obj):
         context = super().feed_extra_kwargs(obj)
-        context["page"] = obj["page"]
-        context["last_page"] = obj["paginator"].num_pages
+        context["pages"] = obj["pages"]
         return context
 
     def item_title(self, item):
@@ -401,9 +513,70 @@ class LogEntryFeed(Feed):
         )
 
 
+def query_int(request, param):
+    try:
+        return int(request.GET[param])
+    except ValueError:
+        raise exceptions.ParseError(f"invalid {param}")
+
+
+def query_datetime(request, param):
+    try:
+        value = parse_datetime(request.GET[param])
+    except ValueError:
+        value = None
+    if value is None:
+        raise exceptions.ParseError(f"invalid {param}")
+    if is_naive(value):
+        value = make_aware(value)
+    return value
+
+
 class FilteredLogEntryFeed(LogEntryFeed):
+    """feed of the log entries matching the query parameters.
+
+    - `action_type`: prefix of the action types, may be given repeatedly
+    - `content_type` (as `app_label.model`) and `object_id`: the object
+      of the entries
+    - `bike`: id of a bike, for the entries of the bike and its trackers
+    - `since` and `until`: time range of the entries, in ISO 8601
+
+    The parameters are kept in the links to the other pages.
+    """
+
     def get_entries(self, request):
-        return CykelLogEntry.objects.order_by("-timestamp").all()
+        entries = super().get_entries(request)
+
+        action_types = Q()
+        for prefix in request.GET.getlist("action_type"):
+            action_types |= Q(action_type__startswith=prefix)
+        entries = entries.filter(action_types)
+
+        if request.GET.get("content_type"):
+            try:
+                app_label, model = request.GET["content_type"].split(".")
+                content_type = ContentType.objects.get_by_natural_key(app_label, model)
+            except (ValueError, ContentType.DoesNotExist):
+                raise exceptions.ParseError("invalid content_type")
+            entries = entries.filter(content_type=content_type)
+        if request.GET.get("object_id"):
+            entries = entries.filter(object_id=query_int(request, "object_id"))
+
+        if request.GET.get("bike"):
+            bike_id = query_int(request, "bike")
+            entries = entries.filter(
+                Q(
+                    content_type=ContentType.objects.get_for_model(Bike),
+                    object_id=bike_id,
+                )
+                | Q(data__contains={"bike_id": bike_id})
+            )
+
+        if request.GET.get("since"):
+            entries = entries.filter(timestamp__gte=query_datetime(request, "since"))
+        if request.GET.get("until"):
+            entries = entries.filter(timestamp__lt=query_datetime(request, "until"))
+        return entries
 
 
 def custom_exception_handler(exc, context):
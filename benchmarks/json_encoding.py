@@ -0,0 +1,64 @@
+"""Micro benchmark of the JSON encoding of a large free_bike_status feed.
+
+Compares the stdlib encoder with cykel.encoders.dumps (which uses orjson
+if it is installed):
+
+    python benchmarks/json_encoding.py [number of bikes]
+"""
+
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings  # noqa: E402
+
+settings.configure()
+
+from django.core.serializers.json import DjangoJSONEncoder  # noqa: E402
+
+from cykel.encoders import dumps, orjson  # noqa: E402
+
+
+def feed(count):
+    bikes = [
+        {
+            "bike_id": str(i),
+            "lat": 48.3984 + i * 1e-6,
+            "lon": 9.9916 - i * 1e-6,
+            "is_reserved": False,
+            "is_disabled": False,
+            "vehicle_type_id": "1",
+            "current_range_meters": Decimal("12345.67"),
+            "last_reported": datetime(2020, 5, 1, 12, 0, i % 60, tzinfo=timezone.utc),
+        }
+        for i in range(count)
+    ]
+    return {
+        "ttl": 60,
+        "last_updated": 1588334400,
+        "data": {"bikes": bikes},
+        "version": "2.1",
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    document = feed(count)
+    runs = 20
+    candidates = {
+        "stdlib": lambda: json.dumps(document, cls=DjangoJSONEncoder).encode("utf-8"),
+        "dumps ({})".format("orjson" if orjson else "stdlib"): lambda: dumps(document),
+    }
+    print("encoding {} bikes, best of {} runs".format(count, runs))
+    for name, encode in candidates.items():
+        best = min(timeit.repeat(encode, number=1, repeat=runs))
+        print("{:>16}: {:8.2f} ms".format(name, best * 1000))
+
+
+if __name__ == "__main__":
+    main()
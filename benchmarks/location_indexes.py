@@ -0,0 +1,112 @@
+"""Benchmark of the latest location lookups on a large location table.
+
+Fills the location table with generated locations (10 million by
+default), shows the query plans of the latest location lookups with the
+indexes of the Location model, and again without them (only with the
+indexes of the foreign keys). Everything runs
+in a transaction, which is rolled back at the end, but use a scratch
+database anyway: the table is locked while the benchmark runs.
+
+    python benchmarks/location_indexes.py [number of locations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cykel.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+from bikesharing.models import Bike, Location, LocationTracker  # noqa: E402
+
+BIKES = 1000
+
+
+class Rollback(Exception):
+    pass
+
+
+def fill(count):
+    bikes = Bike.objects.bulk_create(
+        Bike(bike_number="bench{}".format(number)) for number in range(BIKES)
+    )
+    LocationTracker.objects.bulk_create(
+        LocationTracker(
+            device_id="bench{}-{}".format(bike.id, internal),
+            bike=bike,
+            internal=internal,
+        )
+        for bike in bikes
+        for internal in (False, True)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {location}
+                (bike_id, tracker_id, geo, source, reported_at, internal, report_count)
+            SELECT t.bike_id, t.id,
+                ST_SetSRID(
+                    ST_MakePoint(9.9 + random() / 10, 48.3 + random() / 10), 4326
+                ),
+                %s, now() - g * interval '1 minute', t.internal, 1
+            FROM generate_series(1, %s) AS g, {tracker} AS t
+            WHERE t.device_id LIKE 'bench%%'
+            """.format(
+                location=Location._meta.db_table,
+                tracker=LocationTracker._meta.db_table,
+            ),
+            [Location.Source.TRACKER, count // (2 * BIKES)],
+        )
+        cursor.execute("ANALYZE {}".format(Location._meta.db_table))
+    return bikes[BIKES // 2]
+
+
+def lookups(bike):
+    tracker = bike.locationtracker_set.first()
+    return {
+        "latest public location of a bike": Location.objects.filter(
+            bike=bike, internal=False
+        ).order_by("-reported_at")[:1],
+        "latest location of a tracker": Location.objects.filter(
+            tracker=tracker
+        ).order_by("-reported_at")[:1],
+    }
+
+
+def explain(bike):
+    for name, queryset in lookups(bike).items():
+        start = time.perf_counter()
+        plan = queryset.explain(analyze=True)
+        print("{} ({:.1f} ms):".format(name, (time.perf_counter() - start) * 1000))
+        print(plan)
+        print()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    try:
+        with transaction.atomic():
+            print("generating {} locations...".format(count))
+            bike = fill(count)
+
+            print("=== with indexes ===")
+            explain(bike)
+
+            print("=== without indexes ===")
+            with connection.cursor() as cursor:
+                for index in Location._meta.indexes:
+                    cursor.execute("DROP INDEX {}".format(index.name))
+            explain(bike)
+            raise Rollback()
+    except Rollback:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark of matching many points to stations at once.
+
+Matches random points (1 million by default) around Ulm to generated
+stations, with the vectorized StationIndex.nearest_many and, for a
+sample, with StationIndex.nearest point by point. No database is needed.
+
+    python benchmarks/station_matching.py [number of points] [number of stations]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cykel.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from bikesharing.station_matching import StationIndex  # noqa: E402
+
+# bounding box of the generated points and stations
+WEST, SOUTH, EAST, NORTH = 9.90, 48.35, 10.05, 48.45
+SAMPLE = 10000
+
+
+def random_points(count):
+    return (
+        [random.uniform(WEST, EAST) for _ in range(count)],
+        [random.uniform(SOUTH, NORTH) for _ in range(count)],
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    station_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    station_lons, station_lats = random_points(station_count)
+    stations = list(zip(range(1, station_count + 1), station_lons, station_lats))
+    index = StationIndex(stations, max_distance=50)
+    lons, lats = random_points(count)
+
+    print("{} points, {} stations".format(count, station_count))
+    start = time.perf_counter()
+    station_ids = index.nearest_many(lons, lats)
+    elapsed = time.perf_counter() - start
+    print("nearest_many: {:8.2f} s, {:10.0f} points/s".format(elapsed, count / elapsed))
+
+    sample = min(count, SAMPLE)
+    start = time.perf_counter()
+    sampled_ids = [index.nearest(lons[i], lats[i]) for i in range(sample)]
+    elapsed = time.perf_counter() - start
+    print(
+        "nearest:      {:8.2f} s, {:10.0f} points/s ({} points)".format(
+            elapsed, sample / elapsed, sample
+        )
+    )
+    assert sampled_ids == station_ids[:sample]
+    matched = sum(station_id is not None for station_id in station_ids)
+    print("{} points matched a station".format(matched))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Throughput benchmark of the tracker report endpoints.
+
+Sends the same reports once one by one to /api/bike/updatelocation and
+once in batches to /api/bike/updatelocations, and prints the reports
+per second of both. The generated bikes, trackers and locations are
+created in a transaction, which is rolled back at the end.
+
+    python benchmarks/tracker_ingest.py [number of reports] [batch size]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cykel.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import transaction  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from rest_framework_api_key.models import APIKey  # noqa: E402
+
+from api.views import updatebikelocation, updatebikelocations  # noqa: E402
+from bikesharing.models import Bike, LocationTracker  # noqa: E402
+
+TRACKERS = 500
+
+
+class Rollback(Exception):
+    pass
+
+
+def generate_reports(count):
+    bikes = Bike.objects.bulk_create(
+        Bike(bike_number="bench{}".format(number)) for number in range(TRACKERS)
+    )
+    trackers = LocationTracker.objects.bulk_create(
+        LocationTracker(device_id="bench{}".format(bike.id), bike=bike)
+        for bike in bikes
+    )
+    return [
+        {
+            "device_id": random.choice(trackers).device_id,
+            "lat": 48.3 + random.random() / 10,
+            "lng": 9.9 + random.random() / 10,
+            "battery_voltage": 3.7,
+        }
+        for _ in range(count)
+    ]
+
+
+def measure(name, send, count):
+    start = time.perf_counter()
+    send()
+    elapsed = time.perf_counter() - start
+    print("{:>8}: {:8.1f} reports/s".format(name, count / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    factory = APIRequestFactory()
+    try:
+        with transaction.atomic():
+            _, key = APIKey.objects.create_key(name="benchmark")
+            headers = {"HTTP_AUTHORIZATION": "Api-Key " + key}
+            reports = generate_reports(count)
+
+            def single():
+                for report in reports:
+                    request = factory.post(
+                        "/api/bike/updatelocation", report, format="json", **headers
+                    )
+                    assert updatebikelocation(request).status_code == 200
+
+            def batched():
+                for start in range(0, count, batch_size):
+                    request = factory.post(
+                        "/api/bike/updatelocations",
+                        reports[start : start + batch_size],
+                        format="json",
+                        **headers,
+                    )
+                    assert updatebikelocations(request).status_code == 200
+
+            print("{} reports, batches of {}".format(count, batch_size))
+            measure("single", single, count)
+            measure("batched", batched, count)
+            raise Rollback()
+    except Rollback:
+        pass
+
+
+if __name__ == "__main__":
+    main()
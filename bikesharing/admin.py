@@ -33,7 +33,7 @@ def format_geolocation_text(geolocation):
     if geolocation.accuracy:
         accuracy = ", accuracy: " + str(geolocation.accuracy) + "m"
     timestamp = ", reported at: " + formats.localize(
-        timezone.template_localtime(geolocation.reported_at)
+        timezone.template_localtime(geolocation.last_seen())
     )
     url = OSM_URL.format(lat=lat, lng=lng)
     return "<a href='%s'>%s, %s</a>%s%s" % (
@@ -61,7 +61,15 @@ def format_geolocation_text_with_source(geolocation):
 
 @admin.register(Location)
 class LocationAdmin(LeafletGeoAdmin, admin.ModelAdmin):
-    list_display = ("bike", "tracker", "geo", "source", "reported_at")
+    list_display = (
+        "bike",
+        "tracker",
+        "geo",
+        "source",
+        "reported_at",
+        "last_reported_at",
+        "report_count",
+    )
     list_filter = ("bike", "tracker", "source")
     search_fields = ("bike__bike_number", "tracker__device_id")
     date_hierarchy = "reported_at"
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class BikesharingConfig(AppConfig):
     name = "bikesharing"
+
+    def ready(self):
+        from bikesharing import handlers  # noqa: F401
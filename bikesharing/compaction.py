@@ -0,0 +1,172 @@
+"""Compaction of old locations.
+
+After some days only the shape of a track matters, not every single
+report. The compact_locations task simplifies the tracks of locations
+older than LOCATION_COMPACTION_DAYS with the Douglas-Peucker algorithm:
+a location is removed if the simplified track passes it closer than
+LOCATION_COMPACTION_TOLERANCE meters.
+
+A track is the series of locations of one tracker on one bike (or the
+locations of a bike without tracker), public and internal locations
+separately. Tracks are read in chunks, so memory use doesn't grow with
+their length. Locations referenced by other tables, e.g. the start and
+end locations of rents or the latest locations of bikes, are kept.
+
+Only the locations since the previous run are compacted, its time is
+stored in the preferences. The feeds only show the latest locations,
+which are kept, so compacting doesn't invalidate them.
+"""
+
+import math
+import time
+
+from django.db.models import Q
+from django.utils.timezone import now, timedelta
+from preferences import preferences
+
+from .models import BikeSharePreferences, Location
+from .models.location_pointers import referencing_fields
+from .station_matching import EARTH_RADIUS
+
+
+def _segment_distance(point, start, end):
+    """return the distance of `point` to the segment from `start` to
+    `end`, in the units of the coordinates."""
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    if length:
+        # position of the closest point on the segment, from 0 to 1
+        t = max(0, min(1, ((x - x1) * dx + (y - y1) * dy) / length))
+        x1, y1 = x1 + t * dx, y1 + t * dy
+    return math.hypot(x - x1, y - y1)
+
+
+def simplify(points, tolerance, keep=()):
+    """return the indices of the points of a line, which are kept by the
+    Douglas-Peucker algorithm.
+
+    `points` are (x, y) pairs in a metric projection. The first and the
+    last point and the indices in `keep` are always kept.
+    """
+    if not points:
+        return []
+    anchors = sorted({0, len(points) - 1, *keep})
+    kept = set(anchors)
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        first, last = stack.pop()
+        farthest, index = 0, None
+        for i in range(first + 1, last):
+            d = _segment_distance(points[i], points[first], points[last])
+            if d > farthest:
+                farthest, index = d, i
+        if index is not None and farthest > tolerance:
+            kept.add(index)
+            stack.append((first, index))
+            stack.append((index, last))
+    return sorted(kept)
+
+
+def project(geos):
+    """return the points as (x, y) in meters, in an equirectangular
+    projection, which is precise enough for the extent of a track."""
+    if not geos:
+        return []
+    scale = EARTH_RADIUS * math.pi / 180
+    x_scale = scale * math.cos(math.radians(geos[0].y))
+    return [(geo.x * x_scale, geo.y * scale) for geo in geos]
+
+
+def referenced_locations(location_ids):
+    """return which of the locations are referenced by other tables."""
+    referenced = set()
+    for field in referencing_fields(Location):
+        referenced.update(
+            field.model.objects.filter(**{field.name + "__in": location_ids})
+            .values_list(field.attname, flat=True)
+            .distinct()
+        )
+    return referenced
+
+
+def compact_track(locations, tolerance, chunk_size):
+    """compact a track, given as queryset of its locations. Returns the
+    number of removed locations."""
+    locations = locations.filter(geo__isnull=False).order_by("reported_at", "id")
+    removed = 0
+    # the last location of a chunk is the first of the next one, so the
+    # chunks are simplified as one continuous track
+    previous = []
+    while True:
+        chunk = locations.values_list("id", "reported_at", "geo")
+        if previous:
+            last_id, reported_at, _ = previous[0]
+            # the redundant bound on reported_at alone lets the database
+            # start the scan of the index at the previous chunk
+            chunk = chunk.filter(
+                Q(reported_at__gt=reported_at)
+                | Q(reported_at=reported_at, id__gt=last_id),
+                reported_at__gte=reported_at,
+            )
+        fetched = list(chunk[:chunk_size])
+        chunk = previous + fetched
+
+        ids = [location_id for location_id, _, _ in chunk]
+        referenced = referenced_locations(ids)
+        kept = simplify(
+            project([geo for _, _, geo in chunk]),
+            tolerance,
+            keep=[i for i, location_id in enumerate(ids) if location_id in referenced],
+        )
+        kept_ids = {ids[i] for i in kept}
+        removable = [location_id for location_id in ids if location_id not in kept_ids]
+        if removable:
+            # the delete excludes referenced locations in the same statement,
+            # which also catches references added since the check above, as
+            # there may be no constraints (see bikesharing.partitioning).
+            # So the collector of delete() would find nothing to protect or
+            # set to null, and the post_delete handler nothing to restore
+            # (only referenced locations are pointed at). Skipping both
+            # saves loading every location and sending a signal for each.
+            deletable = Location.objects.filter(pk__in=removable)
+            for field in referencing_fields(Location):
+                references = field.model.objects.filter(
+                    **{field.name + "__in": removable}
+                )
+                deletable = deletable.exclude(pk__in=references.values(field.attname))
+            removed += deletable._raw_delete(deletable.db)
+        if len(fetched) < chunk_size:
+            return removed
+        previous = chunk[-1:]
+
+
+def compact_locations(days, tolerance, chunk_size=5000):
+    """compact the tracks of all locations older than `days` days.
+
+    Only the locations since the last run are compacted. Returns the
+    number of removed locations and the seconds it took.
+    """
+    started = time.monotonic()
+    until = now() - timedelta(days=days)
+    bsp = preferences.BikeSharePreferences
+    since = bsp.location_compacted_until
+    locations = Location.objects.filter(reported_at__lte=until)
+    if since is not None:
+        locations = locations.filter(reported_at__gt=since)
+
+    tracks = (
+        locations.order_by().values_list("tracker_id", "bike_id", "internal").distinct()
+    )
+    removed = 0
+    for tracker_id, bike_id, internal in tracks:
+        track = locations.filter(
+            tracker_id=tracker_id, bike_id=bike_id, internal=internal
+        )
+        removed += compact_track(track, tolerance, chunk_size)
+
+    # saving the preferences would invalidate all feeds, see gbfs.handlers
+    BikeSharePreferences.objects.filter(pk=bsp.pk).update(
+        location_compacted_until=until
+    )
+    return removed, time.monotonic() - started
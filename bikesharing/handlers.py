@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import station_matching, tracker_lookup
+from .models import Location, LocationTracker, LocationTrackerType, Station
+
+
+def invalidate_station_index(sender, **kwargs):
+    station_matching.invalidate()
+
+
+def invalidate_tracker_lookup(sender, **kwargs):
+    tracker_lookup.invalidate()
+
+
+def restore_location_pointers(sender, instance, **kwargs):
+    instance.restore_latest_pointers()
+
+
+post_save.connect(invalidate_station_index, sender=Station)
+post_delete.connect(invalidate_station_index, sender=Station)
+post_save.connect(invalidate_tracker_lookup, sender=LocationTracker)
+post_delete.connect(invalidate_tracker_lookup, sender=LocationTracker)
+post_save.connect(invalidate_tracker_lookup, sender=LocationTrackerType)
+post_delete.connect(invalidate_tracker_lookup, sender=LocationTrackerType)
+post_delete.connect(restore_location_pointers, sender=Location)
@@ -0,0 +1,277 @@
+"""Processing of the location reports of trackers.
+
+Reports are applied in batches: all locations of a batch are inserted
+at once and the trackers and bikes are updated with one query each, no
+matter how many reports the batch contains.
+"""
+
+from collections import Counter
+
+from django.contrib.gis.geos import Point
+from django.db import transaction
+from django.db.models import DateTimeField, F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils.timezone import now, timedelta
+from preferences import preferences
+
+from cykel.models import CykelLogEntry
+from gbfs.handlers import invalidate_feeds
+
+from .models import Bike, Location, LocationTracker, Rent
+from .models.location_pointers import last_seen, point_at_locations
+from .station_matching import distance, find_station_ids
+
+
+def apply_reports(reports):
+    """apply location reports of trackers.
+
+    `reports` is a list of (tracker, data) pairs, where the tracker is
+    from bikesharing.tracker_lookup and data is the validated data of a
+    LocationTrackerUpdateSerializer. Reports are taken as reported now,
+    unless data contains `reported_at`. Returns the result of every
+    report, in the same order.
+
+    With the location_dedup preference, a report close to the last
+    location of its tracker, which isn't more accurate than it, is
+    counted as another report at that location instead of adding a new
+    one. The location keeps the time of its first report as reported_at,
+    so it stays in its partition (see bikesharing.partitioning), the time
+    of the last one is last_reported_at.
+    """
+    timestamp = now()
+    trackers = {}
+    # trackers which reported their battery voltage
+    battery_trackers = {}
+    bikes = Bike.objects.only("state").in_bulk(
+        {tracker.bike_id for tracker, data in reports if tracker.bike_id}
+    )
+    reported = []
+    matched = []
+    results = []
+    new_locations = []
+    merged_locations = {}
+    # number of reports merged into existing locations, by location id
+    merged_reports = Counter()
+
+    bsp = preferences.BikeSharePreferences
+    latest_locations = {}
+    if bsp.location_dedup:
+        latest_locations = mergeable_locations(tracker for tracker, data in reports)
+
+    for tracker, data in reports:
+        reported_at = data.get("reported_at", timestamp)
+        tracker = trackers.setdefault(tracker.pk, tracker)
+        tracker.last_reported = reported_at
+        if "battery_voltage" in data:
+            tracker.battery_voltage = data["battery_voltage"]
+            battery_trackers[tracker.pk] = tracker
+
+        loc = None
+        if data.get("lat") and data.get("lng"):
+            geo = Point(float(data["lng"]), float(data["lat"]), srid=4326)
+            accuracy = float(data["accuracy"]) if data.get("accuracy") else None
+            last = latest_locations.get(tracker.pk)
+            if last is not None and is_mergeable(
+                last, tracker, geo, accuracy, bsp.location_dedup_distance
+            ):
+                loc = last
+                loc.last_reported_at = max(loc.last_seen(), reported_at)
+                if loc.pk:
+                    merged_locations[loc.pk] = loc
+                    merged_reports[loc.pk] += 1
+                else:
+                    loc.report_count += 1
+            else:
+                loc = Location(
+                    source=Location.Source.TRACKER,
+                    reported_at=reported_at,
+                    tracker=tracker,
+                    bike_id=tracker.bike_id,
+                    internal=tracker.internal,
+                    geo=geo,
+                    accuracy=accuracy,
+                )
+                new_locations.append(loc)
+            if bsp.location_dedup:
+                latest_locations[tracker.pk] = loc
+
+        # trackers of the same bike share one instance of it
+        bike = bikes.get(tracker.bike_id)
+        if bike:
+            bike.last_reported = reported_at
+            if loc and not loc.internal:
+                matched.append((bike, loc))
+
+        reported.append((tracker, bike, loc))
+        if loc:
+            results.append({"success": True})
+        else:
+            results.append({"success": True, "warning": "lat/lng missing"})
+
+    # match all public locations to stations at once, later reports of a
+    # bike override its station of earlier ones
+    station_ids = find_station_ids((loc.geo.x, loc.geo.y) for bike, loc in matched)
+    matched_bikes = {}
+    for (bike, loc), station_id in zip(matched, station_ids):
+        bike.current_station_id = station_id
+        matched_bikes[bike.pk] = bike
+
+    with transaction.atomic():
+        # the trackers only have the fields of the reports, see
+        # bikesharing.tracker_lookup
+        LocationTracker.objects.bulk_update(trackers.values(), ["last_reported"])
+        LocationTracker.objects.bulk_update(
+            battery_trackers.values(), ["battery_voltage"]
+        )
+        Location.objects.bulk_create(new_locations)
+        # concurrent reports may be merged into the same locations
+        merged = list(merged_locations.values())
+        seen_at = {loc.pk: loc.last_reported_at for loc in merged}
+        for loc in merged:
+            loc.report_count = F("report_count") + merged_reports[loc.pk]
+            loc.last_reported_at = Greatest(
+                last_seen(), Value(seen_at[loc.pk], output_field=DateTimeField())
+            )
+        Location.objects.bulk_update(merged, ["report_count", "last_reported_at"])
+        for loc in merged:
+            loc.last_reported_at = seen_at[loc.pk]
+        update_location_pointers(new_locations + merged)
+        # the bikes are loaded with their state only, the station is only
+        # set (and saved) for bikes with a public location in this batch
+        Bike.objects.bulk_update(bikes.values(), ["last_reported"])
+        Bike.objects.bulk_update(matched_bikes.values(), ["current_station"])
+
+        for tracker in battery_trackers.values():
+            log_battery_voltage(tracker)
+        for tracker, bike, loc in reported:
+            log_missing_reporting(tracker, bike, loc)
+
+        # the bulk queries send no signals, which would invalidate the feeds
+        if reports:
+            invalidate_feeds("free_bike_status", "station_status")
+
+    return results
+
+
+def mergeable_locations(trackers):
+    """return the last locations of `trackers`, which reports may update,
+    by tracker id.
+
+    Locations of rents are kept as they are.
+    """
+    tracker_ids = LocationTracker.objects.filter(
+        pk__in=[tracker.pk for tracker in trackers]
+    ).values("last_location")
+    # the last location of a tracker is always one of its own
+    locations = {
+        loc.tracker_id: loc for loc in Location.objects.filter(pk__in=tracker_ids)
+    }
+    location_ids = [loc.pk for loc in locations.values()]
+    rents = Rent.objects.filter(
+        Q(start_location__in=location_ids) | Q(end_location__in=location_ids)
+    )
+    rent_locations = set()
+    for start_location_id, end_location_id in rents.values_list(
+        "start_location_id", "end_location_id"
+    ):
+        rent_locations.update((start_location_id, end_location_id))
+    return {
+        tracker_id: loc
+        for tracker_id, loc in locations.items()
+        if loc.pk not in rent_locations
+    }
+
+
+def is_mergeable(loc, tracker, geo, accuracy, max_distance):
+    """return whether a report of `tracker` at `geo` may be merged into
+    `loc`.
+
+    A report with a better accuracy than `loc` is kept as new location.
+    """
+    return (
+        loc.geo is not None
+        and loc.bike_id == tracker.bike_id
+        and loc.internal == tracker.internal
+        and (
+            accuracy is None or (loc.accuracy is not None and accuracy >= loc.accuracy)
+        )
+        and distance(loc.geo.x, loc.geo.y, geo.x, geo.y) <= max_distance
+    )
+
+
+def update_location_pointers(locations):
+    """point bikes and trackers at the latest of `locations`."""
+    pointers = {
+        (Bike, "last_public_location"): {},
+        (Bike, "last_internal_location"): {},
+        (LocationTracker, "last_location"): {},
+    }
+    for loc in sorted(locations, key=lambda loc: loc.last_seen()):
+        if loc.bike_id:
+            if loc.internal:
+                pointers[Bike, "last_internal_location"][loc.bike_id] = loc
+            else:
+                pointers[Bike, "last_public_location"][loc.bike_id] = loc
+        pointers[LocationTracker, "last_location"][loc.tracker_id] = loc
+    for (model, pointer), targets in pointers.items():
+        point_at_locations(model, pointer, targets)
+
+
+def log_battery_voltage(tracker):
+    if (
+        tracker.tracker_status != LocationTracker.Status.ACTIVE
+        or tracker.battery_voltage is None
+        or tracker.tracker_type is None
+    ):
+        return
+
+    data = {"voltage": tracker.battery_voltage}
+    action_type = None
+    action_type_prefix = "cykel.tracker"
+
+    if tracker.bike_id:
+        data["bike_id"] = tracker.bike_id
+        action_type_prefix = "cykel.bike.tracker"
+
+    if (
+        tracker.tracker_type.battery_voltage_critical is not None
+        and tracker.battery_voltage <= tracker.tracker_type.battery_voltage_critical
+    ):
+        action_type = "battery.critical"
+    elif (
+        tracker.tracker_type.battery_voltage_warning is not None
+        and tracker.battery_voltage <= tracker.tracker_type.battery_voltage_warning
+    ):
+        action_type = "battery.warning"
+
+    if action_type is not None:
+        action_type = "{}.{}".format(action_type_prefix, action_type)
+        somehoursago = now() - timedelta(hours=48)
+        CykelLogEntry.create_unless_time(
+            somehoursago,
+            content_object=tracker,
+            action_type=action_type,
+            data=data,
+        )
+
+
+def log_missing_reporting(tracker, bike, loc):
+    someminutesago = now() - timedelta(minutes=15)
+    data = {}
+    if loc:
+        data = {"location_id": loc.id}
+
+    if tracker.tracker_status == LocationTracker.Status.MISSING:
+        action_type = "cykel.tracker.missing_reporting"
+        CykelLogEntry.create_unless_time(
+            someminutesago, content_object=tracker, action_type=action_type, data=data
+        )
+
+    if bike and bike.state == Bike.State.MISSING:
+        action_type = "cykel.bike.missing_reporting"
+        CykelLogEntry.create_unless_time(
+            someminutesago,
+            content_object=bike,
+            action_type=action_type,
+            data=data,
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from bikesharing.models import Bike, Location, LocationTracker
+from bikesharing.models.location_pointers import backfill_location_pointers
+
+
+class Command(BaseCommand):
+    help = "Sets the latest locations of all bikes and trackers from the locations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="number of bikes or trackers updated per statement",
+        )
+
+    def handle(self, *args, **options):
+        bikes, trackers = backfill_location_pointers(
+            Bike, LocationTracker, Location, batch_size=options["batch_size"]
+        )
+        self.stdout.write("Updated {} bikes and {} trackers".format(bikes, trackers))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bikesharing.compaction import compact_locations
+
+
+class Command(BaseCommand):
+    help = "Simplifies the tracks of old locations, removing redundant locations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.LOCATION_COMPACTION_DAYS or 30,
+            help="compact locations older than this many days",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=settings.LOCATION_COMPACTION_TOLERANCE,
+            help="meters a removed location may be away from the simplified track",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="number of locations of a track simplified at once",
+        )
+
+    def handle(self, *args, **options):
+        removed, seconds = compact_locations(
+            options["days"], options["tolerance"], chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(
+            "Removed {} locations in {:.1f} seconds".format(removed, seconds)
+        )
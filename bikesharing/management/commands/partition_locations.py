@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bikesharing.partitioning import is_partitioned, partition_location_table
+
+
+class Command(BaseCommand):
+    help = "Converts the location table into a table partitioned by month"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.LOCATION_PARTITIONS_AHEAD,
+            help="number of months partitions are created for ahead of time",
+        )
+
+    def handle(self, *args, **options):
+        if is_partitioned():
+            raise CommandError("The location table is already partitioned")
+        try:
+            created = partition_location_table(months_ahead=options["months_ahead"])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write("Created {} partitions".format(created))
@@ -0,0 +1,95 @@
+# Generated by Django 3.1.4 on 2020-12-14 17:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+# rows updated per statement, to keep them short on large tables
+BATCH_SIZE = 1000
+
+
+def latest_location(Location, **filters):
+    return Subquery(
+        Location.objects.filter(**filters)
+        .order_by("-reported_at", "-id")
+        .values("id")[:1]
+    )
+
+
+def update_in_batches(model, **values):
+    last_id = model.objects.order_by("-id").values_list("id", flat=True).first()
+    if last_id is None:
+        return
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        model.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(
+            **values
+        )
+
+
+def backfill(apps, schema_editor):
+    Bike = apps.get_model("bikesharing", "Bike")
+    LocationTracker = apps.get_model("bikesharing", "LocationTracker")
+    Location = apps.get_model("bikesharing", "Location")
+    update_in_batches(
+        Bike,
+        last_public_location=latest_location(
+            Location, bike=OuterRef("pk"), internal=False
+        ),
+        last_internal_location=latest_location(
+            Location, bike=OuterRef("pk"), internal=True
+        ),
+    )
+    update_in_batches(
+        LocationTracker,
+        last_location=latest_location(Location, tracker=OuterRef("pk")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bikesharing", "0046_rent_remove_position_20201204_2059"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bike",
+            name="last_internal_location",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="bikesharing.location",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bike",
+            name="last_public_location",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="bikesharing.location",
+            ),
+        ),
+        migrations.AddField(
+            model_name="locationtracker",
+            name="last_location",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="bikesharing.location",
+            ),
+        ),
+        migrations.RunPython(backfill, reverse_code=migrations.RunPython.noop),
+    ]
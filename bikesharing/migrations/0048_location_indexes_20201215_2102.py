@@ -0,0 +1,30 @@
+# Generated by Django 3.1.4 on 2020-12-15 20:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the location table is large, don't lock it while building the indexes
+    atomic = False
+
+    dependencies = [
+        ("bikesharing", "0047_location_pointers_20201214_1810"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="location",
+            index=models.Index(
+                fields=["bike", "internal", "-reported_at"],
+                name="location_bike_latest_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="location",
+            index=models.Index(
+                fields=["tracker", "-reported_at"], name="location_tracker_latest_idx"
+            ),
+        ),
+    ]
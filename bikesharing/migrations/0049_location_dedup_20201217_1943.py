@@ -0,0 +1,41 @@
+# Generated by Django 3.1.4 on 2020-12-17 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bikesharing", "0048_location_indexes_20201215_2102"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bikesharepreferences",
+            name="location_dedup",
+            field=models.BooleanField(
+                default=False,
+                help_text="""If activated, a tracker report close to the last location
+         of the tracker updates that location, instead of adding a new one.""",
+            ),
+        ),
+        migrations.AddField(
+            model_name="bikesharepreferences",
+            name="location_dedup_distance",
+            field=models.IntegerField(
+                default=10,
+                help_text="""Distance (in meters) up to which a tracker report is
+         considered to be at the last location of the tracker.
+         Needs 'Location dedup' activated.""",
+            ),
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="report_count",
+            field=models.PositiveIntegerField(
+                default=1,
+                help_text="""Number of reports at this location. Reports close to the
+         last location of a tracker can update it, instead of adding a new one.""",
+            ),
+        ),
+    ]
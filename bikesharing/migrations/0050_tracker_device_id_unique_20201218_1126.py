@@ -0,0 +1,46 @@
+# Generated by Django 3.1.4 on 2020-12-18 10:26
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_device_ids(apps, schema_editor):
+    LocationTracker = apps.get_model("bikesharing", "LocationTracker")
+    duplicates = (
+        LocationTracker.objects.exclude(device_id="")
+        .values("device_id")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by("device_id")
+    )
+    if duplicates:
+        raise RuntimeError(
+            "The device ids of trackers must be unique. Change the device ids of "
+            "the trackers with duplicate device ids before migrating: {}".format(
+                ", ".join(
+                    "{} ({} trackers)".format(row["device_id"], row["count"])
+                    for row in duplicates
+                )
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bikesharing", "0049_location_dedup_20201217_1943"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            check_duplicate_device_ids, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="locationtracker",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(_negated=True, device_id=""),
+                fields=("device_id",),
+                name="locationtracker_unique_device_id",
+            ),
+        ),
+    ]
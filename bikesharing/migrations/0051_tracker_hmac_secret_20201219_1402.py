@@ -0,0 +1,24 @@
+# Generated by Django 3.1.4 on 2020-12-19 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bikesharing", "0050_tracker_device_id_unique_20201218_1126"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="locationtracker",
+            name="hmac_secret",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="""Secret the tracker signs its reports with (HMAC-SHA256),
+         instead of using an api key. Leave empty to disable.""",
+                max_length=255,
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.4 on 2020-12-22 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bikesharing", "0051_tracker_hmac_secret_20201219_1402"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bikesharepreferences",
+            name="location_compacted_until",
+            field=models.DateTimeField(
+                default=None,
+                editable=False,
+                help_text="""Locations up to this time have been compacted,
+         see LOCATION_COMPACTION_DAYS.""",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.1.4 on 2020-12-22 09:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bikesharing", "0052_location_compacted_until_20201222_0915"),
+    ]
+
+    # foreign keys can't reference a partitioned location table by id, so
+    # they have no constraints with LOCATION_PARTITIONING. Installs enabling
+    # it later drop them when partitioning, see bikesharing.partitioning
+    operations = [
+        migrations.AlterField(
+            model_name="bike",
+            name="last_internal_location",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=not settings.LOCATION_PARTITIONING,
+                default=None,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="bikesharing.location",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="bike",
+            name="last_public_location",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=not settings.LOCATION_PARTITIONING,
+                default=None,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="bikesharing.location",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="locationtracker",
+            name="last_location",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=not settings.LOCATION_PARTITIONING,
+                default=None,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="bikesharing.location",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="rent",
+            name="end_location",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=not settings.LOCATION_PARTITIONING,
+                default=None,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="rent_end_location",
+                to="bikesharing.location",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="rent",
+            name="start_location",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=not settings.LOCATION_PARTITIONING,
+                default=None,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="rent_start_location",
+                to="bikesharing.location",
+            ),
+        ),
+    ]
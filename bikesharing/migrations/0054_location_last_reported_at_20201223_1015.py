@@ -0,0 +1,24 @@
+# Generated by Django 3.1.4 on 2020-12-23 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bikesharing", "0053_location_references_without_constraints_20201222_1040"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="last_reported_at",
+            field=models.DateTimeField(
+                blank=True,
+                default=None,
+                help_text="""Time of the last report at this location, if more than one
+         report was counted. The location keeps the time of its first report.""",
+                null=True,
+            ),
+        ),
+    ]
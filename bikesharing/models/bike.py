@@ -1,11 +1,11 @@
 import uuid
 from textwrap import dedent
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
-from .location import Location
+from .location_pointers import save_without_location_pointers
 
 
 class Bike(models.Model):
@@ -62,6 +62,35 @@ class Bike(models.Model):
         ),
     )
 
+    # maintained by Location.save, see Location.update_latest_pointers. Like
+    # all references to locations, they have no constraint in the database
+    # with LOCATION_PARTITIONING, see bikesharing.partitioning
+    last_public_location = models.ForeignKey(
+        "Location",
+        db_constraint=not settings.LOCATION_PARTITIONING,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+        related_name="+",
+    )
+    last_internal_location = models.ForeignKey(
+        "Location",
+        db_constraint=not settings.LOCATION_PARTITIONING,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+        related_name="+",
+    )
+
+    location_pointers = ("last_public_location", "last_internal_location")
+
+    def save(self, *args, **kwargs):
+        save_without_location_pointers(self, super().save, *args, **kwargs)
+
     def __str__(self):
         return str(self.bike_number)
 
@@ -74,24 +103,10 @@ class Bike(models.Model):
         )
 
     def public_geolocation(self):
-        if not self.id:
-            return None
-        try:
-            return Location.objects.filter(
-                bike=self, internal=False, reported_at__isnull=False
-            ).latest("reported_at")
-        except ObjectDoesNotExist:
-            return None
+        return self.last_public_location
 
     def internal_geolocation(self):
-        if not self.id:
-            return None
-        try:
-            return Location.objects.filter(
-                bike=self, internal=True, reported_at__isnull=False
-            ).latest("reported_at")
-        except ObjectDoesNotExist:
-            return None
+        return self.last_internal_location
 
     class Meta:
         permissions = [
@@ -15,6 +15,24 @@ class BikeSharePreferences(Preferences):
          be hidden from GBFS, if there was no location report.
          Needs 'Gbfs hide bikes after location report silence' activated.""",
     )
+    location_dedup = models.BooleanField(
+        default=False,
+        help_text="""If activated, a tracker report close to the last location
+         of the tracker updates that location, instead of adding a new one.""",
+    )
+    location_dedup_distance = models.IntegerField(
+        default=10,
+        help_text="""Distance (in meters) up to which a tracker report is
+         considered to be at the last location of the tracker.
+         Needs 'Location dedup' activated.""",
+    )
+    location_compacted_until = models.DateTimeField(
+        default=None,
+        null=True,
+        editable=False,
+        help_text="""Locations up to this time have been compacted,
+         see LOCATION_COMPACTION_DAYS.""",
+    )
     gbfs_system_id = models.CharField(editable=True, max_length=255, default="")
     system_name = models.CharField(editable=True, max_length=255, default="")
     system_short_name = models.CharField(editable=True, max_length=255, default="")
@@ -1,7 +1,10 @@
 from django.contrib.gis.db import models as geomodels
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
+from .location_pointers import latest_location, point_at_locations
+
 
 class Location(models.Model):
     class Source(models.TextChoices):
@@ -25,14 +28,86 @@ class Location(models.Model):
         help_text="""Internal locations are not published to the enduser.
          They are useful for backup trackers with lower accuracy e.g. wifi trackers.""",
     )
+    report_count = models.PositiveIntegerField(
+        default=1,
+        help_text="""Number of reports at this location. Reports close to the
+         last location of a tracker can update it, instead of adding a new one.""",
+    )
+    last_reported_at = models.DateTimeField(
+        default=None,
+        null=True,
+        blank=True,
+        help_text="""Time of the last report at this location, if more than one
+         report was counted. The location keeps the time of its first report.""",
+    )
+
+    def last_seen(self):
+        """return the time of the last report at this location."""
+        return self.last_reported_at or self.reported_at
 
     def save(self, *args, **kwargs):
         if self.tracker:
             self.internal = self.tracker.internal
         super().save(*args, **kwargs)
+        self.update_latest_pointers()
+
+    def update_latest_pointers(self):
+        """point the bike and the tracker at this location, unless they
+        already point at a more recent one."""
+        if self.bike_id:
+            if self.internal:
+                pointer = "last_internal_location"
+            else:
+                pointer = "last_public_location"
+            self._update_pointer("bike", pointer)
+        if self.tracker_id:
+            self._update_pointer("tracker", "last_location")
+
+    def _update_pointer(self, relation, pointer):
+        field = self._meta.get_field(relation)
+        updated = point_at_locations(
+            field.related_model, pointer, {getattr(self, field.attname): self}
+        )
+        # keep an already loaded bike or tracker in sync with the database
+        if updated and field.is_cached(self):
+            setattr(getattr(self, relation), pointer, self)
+
+    def restore_latest_pointers(self):
+        """point the bike and the tracker of this deleted location at their
+        latest remaining location, if they pointed at this one."""
+        if self.bike_id:
+            if self.internal:
+                pointer = "last_internal_location"
+            else:
+                pointer = "last_public_location"
+            self._restore_pointer(
+                "bike", pointer, bike=self.bike_id, internal=self.internal
+            )
+        if self.tracker_id:
+            self._restore_pointer("tracker", "last_location", tracker=self.tracker_id)
+
+    def _restore_pointer(self, relation, pointer, **filters):
+        field = self._meta.get_field(relation)
+        # the pointer may already be cleared by on_delete=SET_NULL
+        field.related_model.objects.filter(
+            Q(**{pointer: None}) | Q(**{pointer: self.pk}),
+            pk=getattr(self, field.attname),
+        ).update(**{pointer: latest_location(Location, **filters)})
 
     def __str__(self):
         return str(self.geo)
 
     class Meta:
         get_latest_by = "reported_at"
+        indexes = [
+            # the latest (public or internal) location of a bike
+            models.Index(
+                fields=["bike", "internal", "-reported_at"],
+                name="location_bike_latest_idx",
+            ),
+            # the latest location of a tracker
+            models.Index(
+                fields=["tracker", "-reported_at"],
+                name="location_tracker_latest_idx",
+            ),
+        ]
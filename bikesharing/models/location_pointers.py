@@ -0,0 +1,135 @@
+from django.db.models import (
+    Case,
+    DateTimeField,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+
+def save_without_location_pointers(instance, save, *args, **kwargs):
+    """save an existing instance without its `location_pointers` fields.
+
+    The pointers to the latest locations are updated by Location.save
+    directly in the database, so saving an instance, which was loaded
+    before that, must not write back the old values.
+    """
+    if (
+        not instance._state.adding
+        and not args
+        and kwargs.get("update_fields") is None
+        and not kwargs.get("force_insert")
+    ):
+        deferred = instance.get_deferred_fields()
+        kwargs["update_fields"] = [
+            field.name
+            for field in instance._meta.concrete_fields
+            if not field.primary_key
+            and field.attname not in deferred
+            and field.name not in instance.location_pointers
+        ]
+    save(*args, **kwargs)
+
+
+def last_seen():
+    """expression of the time of the last report at a location, see
+    Location.last_seen."""
+    return Coalesce(F("last_reported_at"), F("reported_at"))
+
+
+def point_at_locations(model, pointer, locations):
+    """point instances of `model` at new locations, unless they already
+    point at a more recent one.
+
+    `locations` maps the ids of the instances to their new locations.
+    Locations are compared by the time of their last report. Returns the
+    number of updated instances.
+    """
+    if not locations:
+        return 0
+    location_id = Case(
+        *(When(pk=pk, then=Value(loc.pk)) for pk, loc in locations.items()),
+        output_field=IntegerField(),
+    )
+    seen_at = Case(
+        *(When(pk=pk, then=Value(loc.last_seen())) for pk, loc in locations.items()),
+        output_field=DateTimeField(),
+    )
+    is_older = (
+        Q(**{pointer: None})
+        | Q(**{pointer + "__last_reported_at__lte": seen_at})
+        | Q(
+            **{
+                pointer + "__last_reported_at": None,
+                pointer + "__reported_at__lte": seen_at,
+            }
+        )
+    )
+    return (
+        model.objects.filter(pk__in=locations)
+        .filter(is_older)
+        .update(**{pointer: location_id})
+    )
+
+
+def referencing_fields(model):
+    """return the foreign keys of all models to `model`, including the
+    ones without a reverse relation."""
+    return [
+        rel.field
+        for rel in model._meta.get_fields(include_hidden=True)
+        if rel.auto_created and not rel.concrete and (rel.one_to_many or rel.one_to_one)
+    ]
+
+
+def latest_location(Location, **filters):
+    """subquery of the id of the latest location matching `filters`, by
+    the time of its last report."""
+    return Subquery(
+        Location.objects.filter(**filters)
+        .order_by(last_seen().desc(), "-id")
+        .values("id")[:1]
+    )
+
+
+def _update_in_batches(queryset, batch_size, **values):
+    last_id = queryset.order_by("-id").values_list("id", flat=True).first()
+    if last_id is None:
+        return 0
+    updated = 0
+    for start in range(0, last_id + 1, batch_size):
+        batch = queryset.filter(id__gte=start, id__lt=start + batch_size)
+        updated += batch.update(**values)
+    return updated
+
+
+def backfill_location_pointers(Bike, LocationTracker, Location, batch_size=1000):
+    """set the location pointers of all bikes and trackers from the
+    location table.
+
+    The models are passed in, so this works with the historical models
+    of migrations. The rows are updated in id ranges of `batch_size`, to
+    keep single statements short on large tables. Returns the number of
+    updated bikes and trackers.
+    """
+    updated_bikes = _update_in_batches(
+        Bike.objects.all(),
+        batch_size,
+        last_public_location=latest_location(
+            Location, bike=OuterRef("pk"), internal=False
+        ),
+        last_internal_location=latest_location(
+            Location, bike=OuterRef("pk"), internal=True
+        ),
+    )
+    updated_trackers = _update_in_batches(
+        LocationTracker.objects.all(),
+        batch_size,
+        last_location=latest_location(Location, tracker=OuterRef("pk")),
+    )
+    return updated_bikes, updated_trackers
@@ -1,8 +1,10 @@
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
-from .location import Location
+from .location_pointers import save_without_location_pointers
 
 
 class LocationTracker(models.Model):
@@ -27,16 +29,53 @@ class LocationTracker(models.Model):
         help_text="""Internal trackers don't publish their locations to the enduser.
          They are useful for backup trackers with lower accuracy e.g. wifi trackers.""",
     )
+    hmac_secret = models.CharField(
+        default="",
+        blank=True,
+        max_length=255,
+        help_text="""Secret the tracker signs its reports with (HMAC-SHA256),
+         instead of using an api key. Leave empty to disable.""",
+    )
+
+    # maintained by Location.save, see Location.update_latest_pointers
+    last_location = models.ForeignKey(
+        "Location",
+        db_constraint=not settings.LOCATION_PARTITIONING,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+        related_name="+",
+    )
+
+    location_pointers = ("last_location",)
+
+    def save(self, *args, **kwargs):
+        save_without_location_pointers(self, super().save, *args, **kwargs)
+
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude=exclude)
+        # django doesn't validate conditional unique constraints
+        if self.device_id and "device_id" not in (exclude or ()):
+            others = LocationTracker.objects.exclude(pk=self.pk)
+            if others.filter(device_id=self.device_id).exists():
+                raise ValidationError(
+                    {"device_id": _("A tracker with this device id already exists.")}
+                )
 
     def current_geolocation(self):
-        if not self.id:
-            return None
-        try:
-            return Location.objects.filter(
-                tracker=self, reported_at__isnull=False
-            ).latest("reported_at")
-        except ObjectDoesNotExist:
-            return None
+        return self.last_location
 
     def __str__(self):
         return str(self.device_id)
+
+    class Meta:
+        constraints = [
+            # trackers are looked up by device id for every report
+            models.UniqueConstraint(
+                fields=["device_id"],
+                condition=~Q(device_id=""),
+                name="locationtracker_unique_device_id",
+            ),
+        ]
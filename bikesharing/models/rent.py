@@ -2,18 +2,15 @@ import uuid
 
 import requests
 from django.conf import settings
-from django.contrib.gis.measure import D
 from django.db import models
 from django.db.utils import IntegrityError
 from django.dispatch import receiver
 from django.utils.timezone import now
-from preferences import preferences
 
 from cykel.models import CykelLogEntry
 
 from .bike import Bike
 from .lock_type import LockType
-from .station import Station
 
 
 class Rent(models.Model):
@@ -21,6 +18,7 @@ class Rent(models.Model):
     rent_end = models.DateTimeField(default=None, null=True, blank=True)
     start_location = models.ForeignKey(
         "Location",
+        db_constraint=not settings.LOCATION_PARTITIONING,
         default=None,
         on_delete=models.PROTECT,
         null=True,
@@ -37,6 +35,7 @@ class Rent(models.Model):
     )
     end_location = models.ForeignKey(
         "Location",
+        db_constraint=not settings.LOCATION_PARTITIONING,
         default=None,
         on_delete=models.PROTECT,
         null=True,
@@ -102,16 +101,14 @@ class Rent(models.Model):
         self.save()
 
         if self.end_location:
+            from bikesharing.station_matching import find_station_id
+
             # attach bike to station if location is closer than X meters
             # distance is configured in preferences
-            max_distance = preferences.BikeSharePreferences.station_match_max_distance
-            station_closer_than_Xm = Station.objects.filter(
-                location__distance_lte=(self.end_location.geo, D(m=max_distance)),
-                status=Station.Status.ACTIVE,
-            ).first()
+            station_closer_than_Xm = find_station_id(self.end_location.geo)
             if station_closer_than_Xm:
-                self.bike.current_station = station_closer_than_Xm
-                self.end_station = station_closer_than_Xm
+                self.bike.current_station_id = station_closer_than_Xm
+                self.end_station_id = station_closer_than_Xm
                 self.save()
             else:
                 self.bike.current_station = None
@@ -0,0 +1,276 @@
+"""Monthly partitions of the location table.
+
+`manage.py partition_locations` converts the location table into a
+table partitioned by range of reported_at, with a partition for every
+month. The maintain_location_partitions task creates the partitions of
+the coming months ahead of time and, with LOCATION_RETENTION_MONTHS,
+drops the partitions of old months.
+
+Locations without a partition of their month go to the archive
+partition. When a partition is dropped, its locations still referenced
+by other tables (e.g. the start and end locations of rents, or the
+latest locations of bikes) are moved to the archive.
+
+In postgres the primary key of a partitioned table has to contain the
+partition key, so it is (id, reported_at) and foreign keys can't
+reference locations by id alone anymore. So partitioning needs the
+LOCATION_PARTITIONING setting, with which the foreign keys to locations
+have no constraints in the database (db_constraint=False, migration
+0053). The conversion drops the constraints, which installs migrated
+before enabling the setting still have. Django still protects
+referenced locations from being deleted, queries which delete
+locations directly must exclude referenced ones (see
+bikesharing.compaction). Indexes of a partitioned table can't be
+created concurrently.
+"""
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from .models import Location
+from .models.location_pointers import referencing_fields
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _table():
+    return Location._meta.db_table
+
+
+def archive_name():
+    return _table() + "_archive"
+
+
+def partition_name(month):
+    return "{}_{:%Y%m}".format(_table(), month)
+
+
+def month_start(moment):
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT EXISTS (
+                SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)
+            )""",
+            [_table()],
+        )
+        return cursor.fetchone()[0]
+
+
+def partitions():
+    """return the months of the monthly partitions, in order."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)""",
+            [_table()],
+        )
+        names = [name for name, in cursor.fetchall()]
+    prefix = _table() + "_"
+    months = []
+    for name in names:
+        suffix = name[len(prefix) :]
+        if name.startswith(prefix) and suffix.isdigit():
+            month = datetime.strptime(suffix, "%Y%m")
+            months.append(month.replace(tzinfo=timezone.utc))
+    return sorted(months)
+
+
+def referencing_constraints():
+    """return the (table, name) of the foreign key constraints of other
+    tables, which reference the location table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT conrelid::regclass::text, conname FROM pg_constraint
+            WHERE confrelid = %s::regclass AND contype = 'f'""",
+            [_table()],
+        )
+        return cursor.fetchall()
+
+
+def partition_location_table(months_ahead=3):
+    """convert the location table into a partitioned table.
+
+    Partitions are created for every month from the first location on,
+    up to `months_ahead` months from now. Returns the number of created
+    partitions.
+    """
+    if not settings.LOCATION_PARTITIONING:
+        raise RuntimeError(
+            "Set LOCATION_PARTITIONING, foreign keys can't reference a "
+            "partitioned location table."
+        )
+    table = _table()
+    unpartitioned = table + "_unpartitioned"
+    with transaction.atomic(), connection.cursor() as cursor:
+        # pending checks of deferred constraints prevent altering tables
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(_qn(table)))
+
+        # the models have no constraints with LOCATION_PARTITIONING, the
+        # database still has them if it was migrated without
+        for referencing_table, constraint in referencing_constraints():
+            cursor.execute(
+                "ALTER TABLE {} DROP CONSTRAINT {}".format(
+                    referencing_table, _qn(constraint)
+                )
+            )
+
+        cursor.execute(
+            """SELECT pg_get_indexdef(indexrelid) FROM pg_index
+            WHERE indrelid = %s::regclass AND NOT indisprimary""",
+            [table],
+        )
+        indexes = [index for index, in cursor.fetchall()]
+        cursor.execute(
+            """SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'""",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute("SELECT min(reported_at) FROM {}".format(_qn(table)))
+        first = cursor.fetchone()[0] or now()
+
+        cursor.execute(
+            "ALTER TABLE {} RENAME TO {}".format(_qn(table), _qn(unpartitioned))
+        )
+        cursor.execute(
+            """CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (reported_at)""".format(_qn(table), _qn(unpartitioned))
+        )
+        cursor.execute("ALTER SEQUENCE {} OWNED BY {}.id".format(sequence, _qn(table)))
+        cursor.execute(
+            "CREATE TABLE {} PARTITION OF {} DEFAULT".format(
+                _qn(archive_name()), _qn(table)
+            )
+        )
+        month = month_start(first)
+        last = add_months(month_start(now()), months_ahead)
+        created = 0
+        while month <= last:
+            cursor.execute(
+                "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)".format(
+                    _qn(partition_name(month)), _qn(table)
+                ),
+                [month.isoformat(), add_months(month, 1).isoformat()],
+            )
+            created += 1
+            month = add_months(month, 1)
+
+        cursor.execute(
+            "INSERT INTO {} SELECT * FROM {}".format(_qn(table), _qn(unpartitioned))
+        )
+        cursor.execute("DROP TABLE {}".format(_qn(unpartitioned)))
+
+        # the indexes and constraints are recreated under their old names,
+        # after copying the locations, which is faster than maintaining them
+        cursor.execute(
+            "ALTER TABLE {} ADD PRIMARY KEY (id, reported_at)".format(_qn(table))
+        )
+        for index in indexes:
+            cursor.execute(index)
+        for constraint, definition in foreign_keys:
+            cursor.execute(
+                "ALTER TABLE {} ADD CONSTRAINT {} {}".format(
+                    _qn(table), _qn(constraint), definition
+                )
+            )
+        cursor.execute("ANALYZE {}".format(_qn(table)))
+    return created
+
+
+def create_partitions(months_ahead):
+    """create the missing partitions of this month and the `months_ahead`
+    next months. Returns the months of the created partitions."""
+    existing = set(partitions())
+    current = month_start(now())
+    created = []
+    for months in range(months_ahead + 1):
+        month = add_months(current, months)
+        if month not in existing:
+            create_partition(month)
+            created.append(month)
+    return created
+
+
+def create_partition(month):
+    """create the partition of `month`, and move the locations of the
+    month from the archive to it."""
+    table = _qn(_table())
+    archive = _qn(archive_name())
+    bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        # postgres refuses to create a partition for locations in the
+        # archive, so they are moved out of the way first
+        cursor.execute("CREATE TEMPORARY TABLE moved_locations (LIKE {})".format(table))
+        cursor.execute(
+            """INSERT INTO moved_locations SELECT * FROM {}
+            WHERE reported_at >= %s AND reported_at < %s""".format(archive),
+            bounds,
+        )
+        cursor.execute(
+            "DELETE FROM {} WHERE reported_at >= %s AND reported_at < %s".format(
+                archive
+            ),
+            bounds,
+        )
+        cursor.execute(
+            "CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)".format(
+                _qn(partition_name(month)), table
+            ),
+            bounds,
+        )
+        cursor.execute("INSERT INTO {} SELECT * FROM moved_locations".format(table))
+        cursor.execute("DROP TABLE moved_locations")
+
+
+def drop_expired_partitions(retention_months):
+    """drop the partitions of the months before the last
+    `retention_months` months.
+
+    Locations referenced by other tables are moved to the archive.
+    Returns the months of the dropped partitions.
+    """
+    table = _qn(_table())
+    references = " UNION ".join(
+        "SELECT {} FROM {}".format(_qn(field.column), _qn(field.model._meta.db_table))
+        for field in referencing_fields(Location)
+    )
+    expired = add_months(month_start(now()), -retention_months)
+    dropped = []
+    for month in partitions():
+        if add_months(month, 1) > expired:
+            break
+        partition = _qn(partition_name(month))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(
+                "ALTER TABLE {} DETACH PARTITION {}".format(table, partition)
+            )
+            # without the partition, the month of the locations is archived
+            cursor.execute(
+                "INSERT INTO {} SELECT * FROM {} WHERE id IN ({})".format(
+                    table, partition, references
+                )
+            )
+            cursor.execute("DROP TABLE {}".format(partition))
+        dropped.append(month)
+    return dropped
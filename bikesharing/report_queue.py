@@ -0,0 +1,116 @@
+"""Queue of tracker reports, which are applied in the background.
+
+With TRACKER_INGEST_ASYNC the tracker endpoints only validate reports
+and push them to this queue. The ingest_tracker_reports task pops them
+in batches and applies them with bikesharing.ingest.
+"""
+
+import json
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import redis
+from django.conf import settings
+
+from .ingest import apply_reports
+from .tracker_lookup import lookup_trackers
+
+
+class RedisReportQueue:
+    key = "cykel:tracker_reports"
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def push(self, reports):
+        self.redis.rpush(self.key, *(json.dumps(report) for report in reports))
+
+    def pop(self, count):
+        with self.redis.pipeline() as pipe:
+            pipe.lrange(self.key, 0, count - 1)
+            pipe.ltrim(self.key, count, -1)
+            reports, _ = pipe.execute()
+        return [json.loads(report) for report in reports]
+
+    def requeue(self, reports):
+        self.redis.lpush(self.key, *(json.dumps(report) for report in reports[::-1]))
+
+    def __len__(self):
+        return self.redis.llen(self.key)
+
+
+class MemoryReportQueue:
+    """a queue within the current process, for tests and development."""
+
+    def __init__(self):
+        self.reports = deque()
+
+    def push(self, reports):
+        self.reports.extend(reports)
+
+    def pop(self, count):
+        return [self.reports.popleft() for _ in range(min(count, len(self.reports)))]
+
+    def requeue(self, reports):
+        self.reports.extendleft(reports[::-1])
+
+    def __len__(self):
+        return len(self.reports)
+
+
+_queues = {}
+
+
+def get_queue():
+    url = settings.TRACKER_INGEST_QUEUE_URL
+    if url not in _queues:
+        if url.startswith("memory://"):
+            _queues[url] = MemoryReportQueue()
+        else:
+            _queues[url] = RedisReportQueue(url)
+    return _queues[url]
+
+
+def enqueue_reports(reports):
+    """queue the validated data of LocationTrackerUpdateSerializers, to be
+    applied as reported now."""
+    if not reports:
+        return
+    received_at = time.time()
+    get_queue().push([dict(report, received_at=received_at) for report in reports])
+
+
+def ingest_queued_reports(batch_size=500):
+    """apply all queued reports, in batches of `batch_size`.
+
+    Reports of unknown trackers are dropped. If a batch fails, it is put
+    back to the front of the queue and the error is raised, so the next
+    run (the celery beat starts one every TRACKER_INGEST_INTERVAL
+    seconds) applies it again. Returns the number of applied reports.
+    """
+    queue = get_queue()
+    applied = 0
+    while True:
+        queued = queue.pop(batch_size)
+        if not queued:
+            return applied
+        try:
+            trackers = lookup_trackers(report["device_id"] for report in queued)
+            reports = []
+            for report in queued:
+                tracker = trackers.get(report["device_id"])
+                if tracker is None:
+                    continue
+                data = {
+                    key: value for key, value in report.items() if key != "received_at"
+                }
+                data["reported_at"] = datetime.fromtimestamp(
+                    report["received_at"], timezone.utc
+                )
+                reports.append((tracker, data))
+            apply_reports(reports)
+        except Exception:
+            queue.requeue(queued)
+            raise
+        applied += len(reports)
@@ -0,0 +1,219 @@
+"""Matching of locations to the nearest active station.
+
+The active stations are kept in an index in every process, so matching
+a location needs no database query. A single location is matched with
+the stations in the grid cells around it, a batch of locations by
+comparing every location with every station, vectorized with numpy.
+
+The index is rebuilt when a station changes (the version in the shared
+cache changes, see bikesharing.handlers), when the
+station_match_max_distance preference is changed and after
+INDEX_TIMEOUT seconds. Without a shared cache (see cykel.cache) other
+processes wouldn't see the changes, so the index is rebuilt for every
+match then.
+"""
+
+import math
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.measure import D
+from django.core.cache import cache
+from preferences import preferences
+
+from cykel.cache import is_shared
+
+from .models import Station
+
+# radius of the sphere ST_DistanceSphere of PostGIS calculates with, which
+# django uses for distance lookups on geographic coordinates
+EARTH_RADIUS = 6370986
+
+VERSION_KEY = "station_matching:version"
+
+# seconds the index is kept in every process, a missed change of a station
+# is seen after at most this time
+INDEX_TIMEOUT = 10
+
+# number of point-station distances calculated at once by nearest_many
+MATRIX_SIZE = 2**21
+
+
+def distance(lon1, lat1, lon2, lat2):
+    """return the distance in meters between two points, on the sphere."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1, math.sqrt(a)))
+
+
+class StationIndex:
+    """grid of stations, with cells at least `max_distance` wide.
+
+    All stations within `max_distance` of a point are in the cell of the
+    point or one of its neighbours.
+    """
+
+    def __init__(self, stations, max_distance):
+        # list of (id, lon, lat)
+        self.stations = stations
+        self.max_distance = max_distance
+        # max_distance in degrees of latitude
+        self.cell_height = max(max_distance, 1) / (EARTH_RADIUS * math.pi / 180)
+        # degrees of longitude get narrower towards the poles, so the width
+        # of the cells is calculated at the latitude of the station farthest
+        # away from the equator (plus some margin for points around it)
+        max_lat = max((abs(lat) for _, _, lat in stations), default=0)
+        max_lat = min(max_lat + self.cell_height + 1, 89)
+        self.cell_width = self.cell_height / math.cos(math.radians(max_lat))
+        self.cells = defaultdict(list)
+        for station in stations:
+            self.cells[self._cell(station[1], station[2])].append(station)
+
+    def _cell(self, lon, lat):
+        return (math.floor(lon / self.cell_width), math.floor(lat / self.cell_height))
+
+    def nearest(self, lon, lat):
+        """return the id of the nearest station within max_distance, or
+        None.
+
+        Of stations with the same distance, the one with the lowest id
+        wins.
+        """
+        x, y = self._cell(lon, lat)
+        nearest = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for station_id, station_lon, station_lat in self.cells.get(
+                    (x + dx, y + dy), ()
+                ):
+                    candidate = (
+                        distance(lon, lat, station_lon, station_lat),
+                        station_id,
+                    )
+                    if candidate[0] <= self.max_distance and (
+                        nearest is None or candidate < nearest
+                    ):
+                        nearest = candidate
+        if nearest is None:
+            return None
+        return nearest[1]
+
+    def nearest_many(self, lons, lats):
+        """return the result of `nearest` for arrays of coordinates, in the
+        same order.
+
+        The distances to all stations are calculated with numpy, in chunks
+        of points, so memory use doesn't grow with the number of points.
+        """
+        lons = np.radians(np.asarray(lons, dtype=float))
+        lats = np.radians(np.asarray(lats, dtype=float))
+        if not self.stations:
+            return [None] * len(lons)
+
+        # stations are ordered by id, argmin picks the lowest id on ties
+        stations = sorted(self.stations)
+        ids = np.array([station[0] for station in stations])
+        station_lons = np.radians([station[1] for station in stations])
+        station_lats = np.radians([station[2] for station in stations])
+        cos_station_lats = np.cos(station_lats)
+
+        nearest = np.full(len(lons), -1)
+        chunk_size = max(1, MATRIX_SIZE // len(stations))
+        for start in range(0, len(lons), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            point_lons = lons[chunk, np.newaxis]
+            point_lats = lats[chunk, np.newaxis]
+            a = (
+                np.sin((station_lats - point_lats) / 2) ** 2
+                + np.cos(point_lats)
+                * cos_station_lats
+                * np.sin((station_lons - point_lons) / 2) ** 2
+            )
+            distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+            closest = np.argmin(distances, axis=1)
+            in_range = distances[np.arange(len(closest)), closest] <= self.max_distance
+            nearest[chunk] = np.where(in_range, ids[closest], -1)
+        return [
+            None if station_id < 0 else station_id for station_id in nearest.tolist()
+        ]
+
+
+def active_stations():
+    """return (id, lon, lat) of all active stations with a location."""
+    stations = Station.objects.filter(
+        status=Station.Status.ACTIVE, location__isnull=False
+    ).values_list("id", "location")
+    return [(station_id, point.x, point.y) for station_id, point in stations]
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+# (version, expiry, index) of this process
+_index = (None, 0, None)
+
+
+def get_index(max_distance=None):
+    global _index
+    if max_distance is None:
+        max_distance = preferences.BikeSharePreferences.station_match_max_distance
+    if not is_shared():
+        return StationIndex(active_stations(), max_distance)
+    version = _version()
+    index_version, expires, index = _index
+    if (
+        index_version != version
+        or expires < time.monotonic()
+        or index.max_distance != max_distance
+    ):
+        index = StationIndex(active_stations(), max_distance)
+        _index = (version, time.monotonic() + INDEX_TIMEOUT, index)
+    return index
+
+
+def find_station_id(geo):
+    """return the id of the nearest active station closer than
+    station_match_max_distance to the point `geo`, or None."""
+    return get_index().nearest(geo.x, geo.y)
+
+
+def find_station_ids(points):
+    """return the ids of the stations find_station_id would return for
+    each of `points`, in the same order.
+
+    `points` are (lon, lat) pairs.
+    """
+    points = list(points)
+    lons = [lon for lon, lat in points]
+    lats = [lat for lon, lat in points]
+    return get_index().nearest_many(lons, lats)
+
+
+def query_station_id(geo):
+    """like find_station_id, but asks the database."""
+    max_distance = preferences.BikeSharePreferences.station_match_max_distance
+    return (
+        Station.objects.filter(
+            location__distance_lte=(geo, D(m=max_distance)),
+            status=Station.Status.ACTIVE,
+        )
+        .annotate(distance=Distance("location", geo))
+        .order_by("distance", "id")
+        .values_list("id", flat=True)
+        .first()
+    )
@@ -1,10 +1,14 @@
 from celery import shared_task
+from django.conf import settings
 from django.db.models import Exists, OuterRef
 from django.utils.timezone import now, timedelta
 
 from cykel.models import CykelLogEntry
 
+from .compaction import compact_locations
 from .models import Bike, LocationTracker, Rent
+from .partitioning import create_partitions, drop_expired_partitions, is_partitioned
+from .report_queue import ingest_queued_reports
 
 
 @shared_task
@@ -58,3 +62,25 @@ def log_missing_tracker_updates():
         CykelLogEntry.create_unless_time(
             eighthours, content_object=tracker, action_type=action_type, data=data
         )
+
+
+@shared_task
+def ingest_tracker_reports():
+    ingest_queued_reports()
+
+
+@shared_task
+def maintain_location_partitions():
+    if not is_partitioned():
+        return
+    create_partitions(settings.LOCATION_PARTITIONS_AHEAD)
+    if settings.LOCATION_RETENTION_MONTHS:
+        drop_expired_partitions(settings.LOCATION_RETENTION_MONTHS)
+
+
+@shared_task
+def compact_old_locations():
+    removed, seconds = compact_locations(
+        settings.LOCATION_COMPACTION_DAYS, settings.LOCATION_COMPACTION_TOLERANCE
+    )
+    return {"removed": removed, "seconds": seconds}
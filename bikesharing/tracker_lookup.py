@@ -0,0 +1,170 @@
+"""Lookup of trackers by device id, for the reports of trackers.
+
+The fields of a tracker, which applying its reports needs, are kept in
+the django cache shared by all processes and, for a few seconds, in a
+small LRU cache in every process, so most reports need no tracker
+query. Any change of a tracker or tracker type invalidates all entries,
+by changing the version in the shared cache (see bikesharing.handlers).
+
+Without a shared cache (see cykel.cache) other processes wouldn't see
+the invalidation, so trackers aren't cached at all then.
+"""
+
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from cykel.cache import is_shared
+
+from .models import LocationTracker, LocationTrackerType
+
+VERSION_KEY = "tracker_lookup:version"
+
+# number of trackers cached in every process
+LOCAL_SIZE = 4096
+
+# seconds trackers are cached in every process, a change of a tracker is
+# seen by the other processes after at most this time
+LOCAL_TIMEOUT = 5
+
+# seconds trackers are cached in the shared cache
+SHARED_TIMEOUT = 3600
+
+# seconds unknown device ids are cached in the shared cache, trackers
+# created without signals (e.g. by bulk_create) are found after this time
+UNKNOWN_TIMEOUT = 60
+
+FIELDS = (
+    "id",
+    "device_id",
+    "bike_id",
+    "internal",
+    "tracker_status",
+    "hmac_secret",
+    "tracker_type_id",
+    "tracker_type__battery_voltage_warning",
+    "tracker_type__battery_voltage_critical",
+)
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _key(version, device_id):
+    return "tracker_lookup:{}:{}".format(version, device_id)
+
+
+# version and (expiry, fields) of this process, by device id
+_local_version = None
+_local = OrderedDict()
+
+
+def _tracker(values):
+    """return a tracker from its cached fields.
+
+    Only the cached fields are set, so the tracker must only be saved
+    with update_fields.
+    """
+    tracker = LocationTracker(
+        id=values["id"],
+        device_id=values["device_id"],
+        bike_id=values["bike_id"],
+        internal=values["internal"],
+        tracker_status=values["tracker_status"],
+        hmac_secret=values["hmac_secret"],
+    )
+    if values["tracker_type_id"] is not None:
+        tracker.tracker_type = LocationTrackerType(
+            id=values["tracker_type_id"],
+            battery_voltage_warning=values["tracker_type__battery_voltage_warning"],
+            battery_voltage_critical=values["tracker_type__battery_voltage_critical"],
+        )
+    tracker._state.adding = False
+    return tracker
+
+
+def _load(device_ids):
+    """return the cached fields of the trackers with the given device ids,
+    False for unknown device ids."""
+    loaded = {device_id: False for device_id in device_ids}
+    trackers = LocationTracker.objects.filter(device_id__in=device_ids).exclude(
+        device_id=""
+    )
+    for values in trackers.values(*FIELDS):
+        loaded[values["device_id"]] = values
+    return loaded
+
+
+def lookup_trackers(device_ids):
+    """return the trackers with the given device ids, by device id (as
+    string).
+
+    The trackers only have the fields needed to apply reports, see
+    FIELDS. Unknown device ids are cached as well.
+    """
+    global _local_version
+    device_ids = {str(device_id) for device_id in device_ids}
+    if not is_shared():
+        found = _load(device_ids) if device_ids else {}
+        return {
+            device_id: _tracker(values) for device_id, values in found.items() if values
+        }
+
+    version = _version()
+    if version != _local_version:
+        _local.clear()
+        _local_version = version
+
+    found = {}
+    now = time.monotonic()
+    for device_id in device_ids:
+        entry = _local.get(device_id)
+        if entry is None:
+            continue
+        expires, values = entry
+        if expires < now:
+            del _local[device_id]
+            continue
+        _local.move_to_end(device_id)
+        found[device_id] = values
+
+    missing = device_ids - found.keys()
+    if missing:
+        keys = {_key(version, device_id): device_id for device_id in missing}
+        for key, values in cache.get_many(keys).items():
+            found[keys[key]] = values
+
+    missing = device_ids - found.keys()
+    if missing:
+        loaded = _load(missing)
+        known = {}
+        unknown = {}
+        for device_id, values in loaded.items():
+            (known if values else unknown)[_key(version, device_id)] = values
+        if known:
+            cache.set_many(known, timeout=SHARED_TIMEOUT)
+        if unknown:
+            cache.set_many(unknown, timeout=UNKNOWN_TIMEOUT)
+        found.update(loaded)
+
+    expires = now + LOCAL_TIMEOUT
+    for device_id, values in found.items():
+        if device_id not in _local:
+            _local[device_id] = (expires, values)
+    while len(_local) > LOCAL_SIZE:
+        _local.popitem(last=False)
+
+    return {
+        device_id: _tracker(values) for device_id, values in found.items() if values
+    }
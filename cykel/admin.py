@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 
@@ -36,6 +37,13 @@ class CykelUserAdmin(UserAdmin):
 admin.site.register(User, CykelUserAdmin)
 
 
+class CykelLogEntryChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # the template displays the entries of the list
+        self.result_list = CykelLogEntry.prefetch_display(self.result_list)
+
+
 @admin.register(CykelLogEntry)
 class CykelLogEntryAdmin(admin.ModelAdmin):
     change_list_template = "admin/change_list_logentry.html"
@@ -50,6 +58,9 @@ class CykelLogEntryAdmin(admin.ModelAdmin):
         "data",
     )
 
+    def get_changelist(self, request, **kwargs):
+        return CykelLogEntryChangeList
+
     def has_view_perission(self, request, obj=None):
         if request.user.has_perm("bikesharing.maintain"):
             return True
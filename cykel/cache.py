@@ -0,0 +1,36 @@
+"""Helpers for the django cache."""
+
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# backends, which aren't shared by the processes
+LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias="default"):
+    """return whether the cache is shared by all processes.
+
+    Entries, invalidations and claims (cache.add) of one process are
+    only seen by the other processes with a shared cache like redis or
+    memcached.
+    """
+    return not isinstance(caches[alias], LOCAL_BACKENDS)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared():
+        return []
+    return [
+        checks.Warning(
+            "The default cache is not shared by the processes.",
+            hint=(
+                "Set CACHE_URL to a shared cache like redis. Without it, "
+                "the trackers of reports and the stations they are matched "
+                "to are not cached, and tracker signatures are rejected."
+            ),
+            id="cykel.W001",
+        )
+    ]
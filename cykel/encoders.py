@@ -0,0 +1,27 @@
+"""JSON encoding backend, using orjson if it is installed."""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data, encoder=DjangoJSONEncoder):
+    """encode data as utf-8 encoded json.
+
+    Values orjson doesn't encode the same way as the stdlib encoder
+    (datetimes, Decimals, lazy translation strings, ...) are passed to
+    the `default` method of `encoder`, so both backends produce the same
+    values. Only the whitespace differs.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=encoder().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(data, cls=encoder).encode("utf-8")
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.4 on 2020-12-20 09:15
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the log grows with every report, don't lock it while building the indexes
+    atomic = False
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("cykel", "0003_cykellogentry"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="cykellogentry",
+            options={
+                "ordering": ("-timestamp", "-id"),
+                "verbose_name": "Log Entry",
+                "verbose_name_plural": "Log Entries",
+            },
+        ),
+        AddIndexConcurrently(
+            model_name="cykellogentry",
+            index=models.Index(
+                fields=["content_type", "object_id", "action_type", "-timestamp"],
+                name="logentry_object_action_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="cykellogentry",
+            index=models.Index(fields=["-timestamp", "-id"], name="logentry_feed_idx"),
+        ),
+        # replaced by logentry_feed_idx
+        migrations.AlterField(
+            model_name="cykellogentry",
+            name="timestamp",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
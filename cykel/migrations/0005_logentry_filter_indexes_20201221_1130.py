@@ -0,0 +1,32 @@
+# Generated by Django 3.1.4 on 2020-12-21 10:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the log grows with every report, don't lock it while building the indexes
+    atomic = False
+
+    dependencies = [
+        ("cykel", "0004_logentry_indexes_20201220_1015"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="cykellogentry",
+            index=models.Index(
+                fields=["action_type", "-timestamp"],
+                name="logentry_action_idx",
+                opclasses=["varchar_pattern_ops", "timestamptz_ops"],
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="cykellogentry",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["data"], name="logentry_data_idx", opclasses=["jsonb_path_ops"]
+            ),
+        ),
+    ]
@@ -1,10 +1,16 @@
+import math
+from collections import defaultdict
+
 from django.contrib.admin.options import get_content_type_for_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.utils.html import format_html
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 # log texts that only contain {object}
@@ -51,18 +57,45 @@ LOG_TEXTS = {
 }
 
 
+def _remember(key, timestamp, window):
+    """remember the time of the last log entry of `key` for `window`, once
+    the current transaction is committed."""
+    timeout = max(1, math.ceil(window.total_seconds()))
+    transaction.on_commit(lambda: cache.set(key, timestamp, timeout=timeout))
+
+
 class CykelLogEntry(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField(db_index=True)
     content_object = GenericForeignKey("content_type", "object_id")
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
     action_type = models.CharField(max_length=200)
     data = models.JSONField(default=dict)
 
     class Meta:
-        ordering = ("-timestamp",)
+        ordering = ("-timestamp", "-id")
         verbose_name = "Log Entry"
         verbose_name_plural = "Log Entries"
+        indexes = [
+            # the latest entries of an action of an object, see
+            # create_unless_time
+            models.Index(
+                fields=["content_type", "object_id", "action_type", "-timestamp"],
+                name="logentry_object_action_idx",
+            ),
+            # entries in the order of the feed, newest first
+            models.Index(fields=["-timestamp", "-id"], name="logentry_feed_idx"),
+            # entries of action types by prefix, see FilteredLogEntryFeed
+            models.Index(
+                fields=["action_type", "-timestamp"],
+                name="logentry_action_idx",
+                opclasses=["varchar_pattern_ops", "timestamptz_ops"],
+            ),
+            # entries by their data, e.g. the bike_id of tracker entries
+            GinIndex(
+                fields=["data"], name="logentry_data_idx", opclasses=["jsonb_path_ops"]
+            ),
+        ]
 
     def delete(self, using=None, keep_parents=False):
         raise TypeError("Logs cannot be deleted.")
@@ -75,23 +108,107 @@ class CykelLogEntry(models.Model):
 
     @staticmethod
     def create_unless_time(timefilter, **kwargs):
+        """create a log entry, unless the same action was logged for the
+        object since `timefilter`.
+
+        The time of the last entry is remembered in the cache until the
+        window is over, so the database is only asked on a cache miss.
+        The cache is only written once the transaction is committed, so a
+        rolled back entry is never remembered. Other processes only see
+        the remembered entries with a shared cache (see cykel.cache).
+
+        This doesn't lock: concurrent callers in different transactions
+        may both log the action.
+        """
         obj = kwargs["content_object"]
         action_type = kwargs["action_type"]
-        if not CykelLogEntry.objects.filter(
-            content_type=get_content_type_for_model(obj),
-            object_id=obj.pk,
-            action_type=action_type,
-            timestamp__gte=timefilter,
-        ).exists():
-            CykelLogEntry.objects.create(**kwargs)
+        content_type = get_content_type_for_model(obj)
+        key = "logentry:{}:{}:{}".format(content_type.pk, obj.pk, action_type)
+        timestamp = now()
+
+        last = cache.get(key)
+        if last is None:
+            last = (
+                CykelLogEntry.objects.filter(
+                    content_type=content_type,
+                    object_id=obj.pk,
+                    action_type=action_type,
+                    timestamp__gte=timefilter,
+                )
+                .order_by("-timestamp")
+                .values_list("timestamp", flat=True)
+                .first()
+            )
+            if last is not None:
+                _remember(key, last, last - timefilter)
+        if last is not None and last >= timefilter:
+            return
+
+        CykelLogEntry.objects.create(**kwargs)
+        _remember(key, timestamp, timestamp - timefilter)
+
+    @staticmethod
+    def prefetch_display(entries):
+        """load the objects shown by display() of all `entries` at once,
+        with one query per model instead of several queries per entry.
+        Returns the entries."""
+        entries = list(entries)
+        ids = defaultdict(set)
+        for entry in entries:
+            for model, pk in entry.display_references():
+                ids[model].add(model._meta.pk.to_python(pk))
+        objects = {}
+        for model, pks in ids.items():
+            for pk, obj in model._base_manager.in_bulk(pks).items():
+                objects[model, pk] = obj
+        for entry in entries:
+            entry._display_objects = objects
+        return entries
+
+    def display_references(self):
+        """return the model and pk of every object shown by display()."""
+        from bikesharing.models import Bike, Location, Station
+
+        references = []
+        model = ContentType.objects.get_for_id(self.content_type_id).model_class()
+        if model is not None:
+            references.append((model, self.object_id))
+        if self.action_type not in LOG_TEXTS:
+            return references
+
+        if self.action_type.startswith("cykel.bike.tracker."):
+            if self.data.get("bike_id"):
+                references.append((Bike, self.data["bike_id"]))
+        if self.action_type.startswith("cykel.bike.rent."):
+            if self.action_type.endswith(".station") and self.data.get("station_id"):
+                references.append((Station, self.data["station_id"]))
+            if self.action_type.endswith(".freefloat") and self.data.get("location_id"):
+                references.append((Location, self.data["location_id"]))
+        return references
+
+    def get_display_object(self, model, pk):
+        """return an object shown by display(), prefetched by
+        prefetch_display if possible."""
+        objects = getattr(self, "_display_objects", None)
+        if objects is None:
+            return model.objects.get(pk=pk)
+        try:
+            return objects[model, model._meta.pk.to_python(pk)]
+        except KeyError:
+            raise model.DoesNotExist
 
     def display_object(self):
         from bikesharing.models import Bike, LocationTracker, Rent
 
-        try:
-            co = self.content_object
-        except ObjectDoesNotExist:
-            return ""
+        objects = getattr(self, "_display_objects", None)
+        if objects is not None:
+            model = ContentType.objects.get_for_id(self.content_type_id).model_class()
+            co = objects.get((model, self.object_id))
+        else:
+            try:
+                co = self.content_object
+            except ObjectDoesNotExist:
+                return ""
 
         text = None
         data = None
@@ -158,7 +275,7 @@ class CykelLogEntry(models.Model):
                 bike_id = self.data.get("bike_id")
                 if bike_id:
                     try:
-                        bike = Bike.objects.get(pk=bike_id)
+                        bike = self.get_display_object(Bike, bike_id)
                         ref = bike.bike_number
                     except ObjectDoesNotExist:
                         ref = bike_id
@@ -185,7 +302,7 @@ class CykelLogEntry(models.Model):
                 station_id = self.data.get("station_id")
                 if station_id:
                     try:
-                        station = Station.objects.get(pk=station_id)
+                        station = self.get_display_object(Station, station_id)
                         ref = station.station_name
                     except ObjectDoesNotExist:
                         ref = station_id
@@ -204,7 +321,7 @@ class CykelLogEntry(models.Model):
                 location_id = self.data.get("location_id")
                 if location_id:
                     try:
-                        loc = Location.objects.get(pk=location_id)
+                        loc = self.get_display_object(Location, location_id)
                         ref = "{}, {}".format(loc.geo.y, loc.geo.x)
                     except ObjectDoesNotExist:
                         ref = location_id
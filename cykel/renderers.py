@@ -0,0 +1,25 @@
+from rest_framework.renderers import JSONRenderer
+
+from .encoders import dumps, orjson
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer, which encodes with orjson if it is installed.
+
+    Indented output (e.g. `Accept: application/json; indent=4`) is left
+    to the stdlib encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b""
+
+        ret = dumps(data, encoder=self.encoder_class)
+        # escape the same characters as JSONRenderer, see there
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
@@ -66,6 +66,7 @@ INSTALLED_APPS = [
     "allauth.socialaccount.providers.slack",
     "admin_override",
     "gbfs",
+    "api",
     "corsheaders",
     "leaflet",
     "preferences",
@@ -129,6 +130,10 @@ DATABASES = {
     )
 }
 
+# Cache
+# use a shared cache like redis in production, the local memory cache is per process
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
 # Celery / Redis
 
 CELERY_BROKER_URL = env.str("REDIS_URL", default="redis://localhost:6379/0")
@@ -203,6 +208,10 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.TokenAuthentication",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "cykel.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "EXCEPTION_HANDLER": "api.views.custom_exception_handler",
 }
 
@@ -242,6 +251,61 @@ if OWNCLOUD_URL is not None:
 
 AUTOENROLLMENT_PROVIDERS = env.list("AUTOENROLLMENT_PROVIDERS", default=[])
 
+# GBFS
+# seconds a rendered feed is served, if no relevant change happens
+GBFS_SNAPSHOT_MAX_AGE = env.int("GBFS_SNAPSHOT_MAX_AGE", default=60)
+# encode free_bike_status while reading the bikes, instead of keeping a snapshot
+GBFS_STREAM_FREE_BIKE_STATUS = env.bool("GBFS_STREAM_FREE_BIKE_STATUS", default=False)
+# directory the feeds are exported to as static files, and the url it is served at
+GBFS_EXPORT_DIR = env.str("GBFS_EXPORT_DIR", default=None)
+GBFS_EXPORT_URL = env.str("GBFS_EXPORT_URL", default=None)
+if GBFS_EXPORT_DIR:
+    CELERY_BEAT_SCHEDULE["export_gbfs"] = {
+        "task": "gbfs.tasks.export_gbfs",
+        "schedule": timedelta(seconds=env.int("GBFS_EXPORT_INTERVAL", default=15)),
+    }
+
+# Tracker reports
+# seconds a verified api key is remembered, instead of verifying its hash again
+API_KEY_CACHE_TIMEOUT = env.int("API_KEY_CACHE_TIMEOUT", default=60)
+# seconds the timestamp of a tracker signature may differ from the server time
+TRACKER_SIGNATURE_MAX_AGE = env.int("TRACKER_SIGNATURE_MAX_AGE", default=300)
+# only queue reports at the tracker endpoints, and apply them in the background
+TRACKER_INGEST_ASYNC = env.bool("TRACKER_INGEST_ASYNC", default=False)
+# redis url of the queue, or memory:// for a queue within the process
+TRACKER_INGEST_QUEUE_URL = env.str(
+    "TRACKER_INGEST_QUEUE_URL", default=CELERY_BROKER_URL
+)
+if TRACKER_INGEST_ASYNC:
+    CELERY_BEAT_SCHEDULE["ingest_tracker_reports"] = {
+        "task": "bikesharing.tasks.ingest_tracker_reports",
+        "schedule": timedelta(seconds=env.int("TRACKER_INGEST_INTERVAL", default=2)),
+    }
+
+# Location partitions, see bikesharing/partitioning.py
+# allow to partition the location table with `manage.py partition_locations`,
+# foreign keys to locations have no constraints in the database then
+LOCATION_PARTITIONING = env.bool("LOCATION_PARTITIONING", default=False)
+# months the partitions of the location table are created ahead of time
+LOCATION_PARTITIONS_AHEAD = env.int("LOCATION_PARTITIONS_AHEAD", default=3)
+# months locations are kept, locations of rents are archived (unset: keep all)
+LOCATION_RETENTION_MONTHS = env.int("LOCATION_RETENTION_MONTHS", default=None)
+CELERY_BEAT_SCHEDULE["maintain_location_partitions"] = {
+    "task": "bikesharing.tasks.maintain_location_partitions",
+    "schedule": timedelta(hours=6),
+}
+
+# Location compaction, see bikesharing/compaction.py
+# days after which the tracks of locations are simplified (unset: keep all)
+LOCATION_COMPACTION_DAYS = env.int("LOCATION_COMPACTION_DAYS", default=None)
+# meters a removed location may be away from the simplified track
+LOCATION_COMPACTION_TOLERANCE = env.float("LOCATION_COMPACTION_TOLERANCE", default=20)
+if LOCATION_COMPACTION_DAYS:
+    CELERY_BEAT_SCHEDULE["compact_old_locations"] = {
+        "task": "bikesharing.tasks.compact_old_locations",
+        "schedule": timedelta(hours=24),
+    }
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
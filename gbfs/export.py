@@ -0,0 +1,59 @@
+"""Export of the GBFS feeds as static files.
+
+The files are written from the same snapshots the views serve, so a web
+server like nginx can publish them without touching django.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .snapshot import ENCODINGS, FEEDS, get_snapshot
+from .views import getFeedBuilder
+
+# file extensions of the precompressed files, e.g. for nginx gzip_static
+ENCODING_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+def write_atomic(path, content):
+    """write the file by renaming a temporary file, so readers never see a
+    partially written file."""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=".{}.".format(path.name), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def export_feeds(directory=None, root=None):
+    """write every feed into `directory` and return the names of the written
+    feeds.
+
+    gbfs.json is only written, if the url the files are published at is
+    known, it defaults to GBFS_EXPORT_URL.
+    """
+    directory = Path(directory or settings.GBFS_EXPORT_DIR)
+    root = root or settings.GBFS_EXPORT_URL
+    directory.mkdir(parents=True, exist_ok=True)
+
+    feeds = list(FEEDS)
+    if root:
+        feeds.append("gbfs")
+    for feed in feeds:
+        build, variant = getFeedBuilder(feed, root)
+        path = directory / "{}.json".format(feed)
+        snapshot = get_snapshot(feed, build, variant=variant)
+        write_atomic(path, snapshot.body)
+        for encoding in ENCODINGS:
+            snapshot = get_snapshot(feed, build, variant=variant, encoding=encoding)
+            suffix = ENCODING_SUFFIXES[encoding]
+            write_atomic(path.with_name(path.name + suffix), snapshot.body)
+    return feeds
@@ -1,4 +1,23 @@
 from corsheaders.signals import check_request_enabled
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from bikesharing.models import (
+    Bike,
+    BikeSharePreferences,
+    Location,
+    Station,
+    VehicleType,
+)
+
+from .snapshot import FEEDS, invalidate
+from .tasks import export_gbfs
+
+# seconds an export is delayed after a change, so following changes are
+# written by the same export
+EXPORT_DELAY = 5
 
 
 # Allow CORS for All GBFS Urls
@@ -7,3 +26,42 @@ def cors_allow(sender, request, **kwargs):
 
 
 check_request_enabled.connect(cors_allow)
+
+
+# feeds, that have to be rebuilt when an instance of the model changes
+FEED_DEPENDENCIES = {
+    Bike: ("free_bike_status", "station_status"),
+    Location: ("free_bike_status", "station_status"),
+    Station: ("station_information", "station_status"),
+    VehicleType: ("vehicle_types", "free_bike_status", "station_status"),
+    BikeSharePreferences: FEEDS,
+}
+
+
+def invalidate_snapshots(sender, **kwargs):
+    invalidate_feeds(*FEED_DEPENDENCIES[sender])
+
+
+def invalidate_feeds(*feeds):
+    """invalidate the snapshots of `feeds` after a change, and schedule
+    an export of the feeds.
+
+    Changes which bypass the signals, e.g. bulk updates, call this
+    directly.
+    """
+    invalidate(*feeds)
+    # invalidate again, when the change is visible to other connections,
+    # so no snapshot is built from the data before the change
+    transaction.on_commit(lambda: invalidate(*feeds))
+    if settings.GBFS_EXPORT_DIR:
+        transaction.on_commit(schedule_export)
+
+
+def schedule_export():
+    if cache.add("gbfs:export:scheduled", True, timeout=EXPORT_DELAY):
+        export_gbfs.apply_async(countdown=EXPORT_DELAY)
+
+
+for model in FEED_DEPENDENCIES:
+    post_save.connect(invalidate_snapshots, sender=model)
+    post_delete.connect(invalidate_snapshots, sender=model)
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gbfs.export import export_feeds
+
+
+class Command(BaseCommand):
+    help = "Writes all GBFS feeds as static files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir",
+            default=settings.GBFS_EXPORT_DIR,
+            help="directory the feeds are written to, defaults to GBFS_EXPORT_DIR",
+        )
+        parser.add_argument(
+            "--url",
+            default=settings.GBFS_EXPORT_URL,
+            help="url the directory is published at, defaults to GBFS_EXPORT_URL",
+        )
+
+    def handle(self, *args, **options):
+        if not options["dir"]:
+            raise CommandError("Set GBFS_EXPORT_DIR or pass --dir")
+        feeds = export_feeds(options["dir"], root=options["url"])
+        if "gbfs" not in feeds:
+            self.stderr.write(
+                "gbfs.json was not written, set GBFS_EXPORT_URL or pass --url"
+            )
+        self.stdout.write("Exported {} feeds".format(len(feeds)))
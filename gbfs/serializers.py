@@ -1,7 +1,4 @@
-from datetime import timedelta
-
 from django.utils.timezone import now
-from preferences import preferences
 from rest_framework import fields, serializers
 
 from bikesharing.models import Bike, Station, VehicleType
@@ -89,19 +86,9 @@ class GbfsStationStatusSerializer(serializers.HyperlinkedModelSerializer):
     vehicles = serializers.SerializerMethodField()
 
     def get_vehicles(self, obj):
-        # if configured filter vehicles, where time report
-        # is older than configure allowed silent timeperiod
-        bsp = preferences.BikeSharePreferences
-        if bsp.gbfs_hide_bikes_after_location_report_silence:
-            available_bikes = obj.bike_set.filter(
-                availability_status=Bike.Availability.AVAILABLE,
-                last_reported__gte=now()
-                - timedelta(hours=bsp.gbfs_hide_bikes_after_location_report_hours),
-            )
-        else:
-            available_bikes = obj.bike_set.filter(
-                availability_status=Bike.Availability.AVAILABLE
-            )
+        # the available bikes are grouped by station in the view,
+        # see GbfsStationStatusViewSet
+        available_bikes = self.context["vehicles"].get(obj.id, [])
         vehicles = GbfsVehicleOnStationSerializer(available_bikes, many=True).data
         return list(filter(lambda val: val is not None, vehicles))
 
@@ -0,0 +1,210 @@
+"""Rendered snapshots of the GBFS feeds.
+
+Every feed is built once and the encoded document is kept in the django
+cache. It is served from there until a relevant change invalidates the
+feed (see gbfs.handlers) or GBFS_SNAPSHOT_MAX_AGE seconds have passed.
+The `ttl` of the feeds is the remaining lifetime of their snapshot.
+"""
+
+import gzip
+import hashlib
+import math
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from cykel.encoders import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GBFS_VERSION = "2.1"
+
+# the feeds listed in gbfs.json, in that order
+FEEDS = (
+    "system_information",
+    "station_information",
+    "station_status",
+    "free_bike_status",
+    "vehicle_types",
+)
+
+SnapshotInfo = namedtuple("SnapshotInfo", ["etag", "built_at"])
+Snapshot = namedtuple("Snapshot", ["etag", "built_at", "body"])
+
+# content codings the snapshots are stored in, in order of preference
+ENCODINGS = {"gzip": gzip.compress}
+if brotli is not None:
+    ENCODINGS = {"br": brotli.compress, **ENCODINGS}
+
+
+def parse_accept_encoding(accept_encoding):
+    """return the q-values of the content codings of an Accept-Encoding
+    header, by coding."""
+    codings = {}
+    for element in accept_encoding.split(","):
+        coding, *params = element.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        qvalue = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    qvalue = float(value.strip())
+                except ValueError:
+                    qvalue = 0.0
+        codings[coding] = qvalue
+    return codings
+
+
+def accepted_encoding(accept_encoding):
+    """return the preferred content coding of an Accept-Encoding header.
+
+    The stored coding with the highest q-value is preferred, codings
+    with a q-value of 0 are not acceptable. If none of them is accepted,
+    or the client prefers `identity` explicitly, None is returned.
+    """
+    codings = parse_accept_encoding(accept_encoding)
+    preferred, preferred_qvalue = None, codings.get("identity", 0)
+    for encoding in ENCODINGS:
+        qvalue = codings.get(encoding, codings.get("*", 0))
+        if qvalue > preferred_qvalue:
+            preferred, preferred_qvalue = encoding, qvalue
+    return preferred
+
+
+def _encoded_etag(etag, encoding):
+    # every stored representation needs its own strong etag
+    if encoding is None:
+        return etag
+    return '{}-{}"'.format(etag[:-1], encoding)
+
+
+def _version_key(feed):
+    return "gbfs:version:{}".format(feed)
+
+
+def feed_version(feed):
+    """return the current data version of a feed.
+
+    The version is a random token, which is replaced on every
+    invalidation.
+    """
+    key = _version_key(feed)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(*feeds):
+    cache.set_many(
+        {_version_key(feed): uuid.uuid4().hex for feed in feeds}, timeout=None
+    )
+
+
+def gbfs_document(data, ttl=0, last_updated=None):
+    if last_updated is None:
+        last_updated = int(time.time())
+    return {
+        "ttl": ttl,
+        "last_updated": last_updated,
+        "data": data,
+        "version": GBFS_VERSION,
+    }
+
+
+def _snapshot_key(feed, variant):
+    return "gbfs:snapshot:{}:{}:{}".format(feed, feed_version(feed), variant)
+
+
+def _is_fresh(built_at):
+    return time.time() - built_at < settings.GBFS_SNAPSHOT_MAX_AGE
+
+
+def remaining_ttl(built_at):
+    """return the seconds until a snapshot built at `built_at` expires."""
+    age = time.time() - built_at
+    return max(0, math.ceil(settings.GBFS_SNAPSHOT_MAX_AGE - age))
+
+
+def render_document(data_body, ttl, last_updated):
+    """return the encoded document of a feed, around its encoded data."""
+    # the document without data, to get the parts around it
+    document = dumps(gbfs_document(None, ttl=ttl, last_updated=last_updated))
+    head, tail = document.split(b"null", 1)
+    return head + data_body + tail
+
+
+def get_snapshot_info(feed, variant="", encoding=None):
+    """return etag and build time of the valid snapshot of a feed.
+
+    This doesn't load the body of the snapshot, so it is cheap enough
+    to answer conditional requests. If there is no valid snapshot, None
+    is returned.
+    """
+    info = cache.get(_snapshot_key(feed, variant))
+    if info is None or not _is_fresh(info.built_at):
+        return None
+    return SnapshotInfo(etag=_encoded_etag(info.etag, encoding), built_at=info.built_at)
+
+
+def get_snapshot(feed, build_data, variant="", encoding=None):
+    """return the snapshot of a feed, building it if there is no valid one.
+
+    `build_data` is called without arguments and returns the `data`
+    part of the feed. `variant` distinguishes snapshots of the same feed
+    which depend on the request, e.g. the host or the language. The body
+    of the snapshot is compressed with the content coding `encoding`, if
+    given.
+
+    The `ttl` of the document is the remaining lifetime of the snapshot,
+    so the body changes every second. It is rendered from the encoded
+    data once per second and coding, and its etag is weak.
+    """
+    max_age = settings.GBFS_SNAPSHOT_MAX_AGE
+    key = _snapshot_key(feed, variant)
+    data_key = "{}:data".format(key)
+    info = cache.get(key)
+    if info is not None and _is_fresh(info.built_at):
+        data_body = None
+    else:
+        built_at = time.time()
+        data_body = dumps(build_data())
+        etag = 'W/"{}"'.format(hashlib.md5(data_body).hexdigest())
+        info = SnapshotInfo(etag=etag, built_at=built_at)
+        if max_age > 0:
+            cache.set_many({key: info, data_key: data_body}, timeout=max_age)
+
+    ttl = remaining_ttl(info.built_at)
+    # the build time tells apart the bodies of snapshots of the same version
+    body_key = "{}:body:{!r}:{}:{}".format(
+        key, info.built_at, encoding or "identity", ttl
+    )
+    body = cache.get(body_key) if max_age > 0 else None
+    if body is None:
+        if data_body is None:
+            data_body = cache.get(data_key)
+        if data_body is None:
+            # evicted from the cache
+            cache.delete(key)
+            return get_snapshot(feed, build_data, variant=variant, encoding=encoding)
+        body = render_document(data_body, ttl, int(info.built_at))
+        if encoding is not None:
+            body = ENCODINGS[encoding](body)
+        if max_age > 0:
+            # the ttl in the body changes within a second
+            cache.set(body_key, body, timeout=2)
+    return Snapshot(
+        etag=_encoded_etag(info.etag, encoding),
+        built_at=info.built_at,
+        body=body,
+    )
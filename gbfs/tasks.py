@@ -0,0 +1,11 @@
+from celery import shared_task
+from django.conf import settings
+
+from .export import export_feeds
+
+
+@shared_task
+def export_gbfs():
+    if not settings.GBFS_EXPORT_DIR:
+        return
+    export_feeds()
@@ -1,9 +1,12 @@
-import time
+from collections import defaultdict
 from datetime import timedelta
+from functools import partial
 
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import translation
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django.utils.timezone import now
 from preferences import preferences
 from rest_framework import generics, mixins
@@ -11,6 +14,7 @@ from rest_framework.decorators import permission_classes
 from rest_framework.permissions import AllowAny
 
 from bikesharing.models import Bike, Station, VehicleType
+from cykel.encoders import dumps
 
 from .serializers import (
     GbfsFreeBikeStatusSerializer,
@@ -18,51 +22,43 @@ from .serializers import (
     GbfsStationStatusSerializer,
     GbfsVehicleTypeSerializer,
 )
+from .snapshot import (
+    FEEDS,
+    accepted_encoding,
+    gbfs_document,
+    get_snapshot,
+    get_snapshot_info,
+)
+
+# number of bikes fetched from the database cursor at once, when streaming
+STREAM_CHUNK_SIZE = 500
 
 
 def gbfs(request):
     if request.method == "GET":
-        data = {
-            languageCode(): {
-                "feeds": [
-                    {
-                        "name": "system_information",
-                        "url": getGbfsRoot(request) + "system_information.json",
-                    },
-                    {
-                        "name": "station_information",
-                        "url": getGbfsRoot(request) + "station_information.json",
-                    },
-                    {
-                        "name": "station_status",
-                        "url": getGbfsRoot(request) + "station_status.json",
-                    },
-                    {
-                        "name": "free_bike_status",
-                        "url": getGbfsRoot(request) + "free_bike_status.json",
-                    },
-                    {
-                        "name": "vehicle_types",
-                        "url": getGbfsRoot(request) + "vehicle_types.json",
-                    },
-                ]
-            }
-        }
-        return JsonResponse(getGbfsWithData(data), safe=False)
+        return gbfsResponse(request, "gbfs")
 
 
 def gbfsSystemInformation(request):
     if request.method == "GET":
-        bsp = preferences.BikeSharePreferences
-        data = {
-            "system_id": bsp.gbfs_system_id,
-            "license_url": "https://creativecommons.org/publicdomain/zero/1.0/",
-            "language": languageCode(),
-            "name": bsp.system_name,
-            "short_name": bsp.system_short_name,
-            "timezone": settings.TIME_ZONE,
-        }
-        return JsonResponse(getGbfsWithData(data), safe=False)
+        return gbfsResponse(request, "system_information")
+
+
+def gbfsData(root):
+    feeds = [{"name": feed, "url": root + feed + ".json"} for feed in FEEDS]
+    return {languageCode(): {"feeds": feeds}}
+
+
+def systemInformationData():
+    bsp = preferences.BikeSharePreferences
+    return {
+        "system_id": bsp.gbfs_system_id,
+        "license_url": "https://creativecommons.org/publicdomain/zero/1.0/",
+        "language": languageCode(),
+        "name": bsp.system_name,
+        "short_name": bsp.system_short_name,
+        "timezone": settings.TIME_ZONE,
+    }
 
 
 @permission_classes([AllowAny])
@@ -70,30 +66,54 @@ class GbfsFreeBikeStatusViewSet(mixins.ListModelMixin, generics.GenericAPIView):
     serializer_class = GbfsFreeBikeStatusSerializer
 
     def get(self, request, *args, **kwargs):
+        if settings.GBFS_STREAM_FREE_BIKE_STATUS:
+            return self.stream()
+        return gbfsResponse(request, "free_bike_status")
+
+    def get_bikes(self):
         bsp = preferences.BikeSharePreferences
-        # if configured filter vehicles, where time report
-        # is older than configure allowed silent timepreiod
-        if bsp.gbfs_hide_bikes_after_location_report_silence:
-            bikes = Bike.objects.filter(
-                availability_status=Bike.Availability.AVAILABLE,
-                last_reported__gte=now()
-                - timedelta(hours=bsp.gbfs_hide_bikes_after_location_report_hours),
-                current_station=None,
-                location__isnull=False,
-            ).distinct()
-        else:
-            bikes = Bike.objects.filter(
-                availability_status=Bike.Availability.AVAILABLE,
-                current_station=None,
-                location__isnull=False,
-            ).distinct()
-
-        serializer = GbfsFreeBikeStatusSerializer(bikes, many=True)
+        bikes = filterAvailableBikes(bsp).filter(
+            last_public_location__isnull=False, current_station=None
+        )
+        return bikes.select_related("vehicle_type", "last_public_location")
+
+    def get_data(self):
+        serializer = GbfsFreeBikeStatusSerializer(self.get_bikes(), many=True)
         # filter bikes without data e.g. without public geolocation
         serialized_bikes = [bike for bike in serializer.data if bike is not None]
-        bike_data = {"bikes": serialized_bikes}
-        data = getGbfsWithData(bike_data)
-        return JsonResponse(data, safe=False)
+        return {"bikes": serialized_bikes}
+
+    def stream(self):
+        """stream the feed, without holding all bikes in memory.
+
+        The bikes are read through a server side cursor and encoded one
+        by one, which bypasses the snapshots.
+        """
+        bikes = self.get_bikes().iterator(chunk_size=STREAM_CHUNK_SIZE)
+        serializer = GbfsFreeBikeStatusSerializer()
+        # encode the document without bikes, to get the parts around them
+        document = dumps(gbfs_document({"bikes": []}))
+        head, tail = document.split(b"[]")
+
+        def render():
+            chunk = [head, b"["]
+            separator = b""
+            for bike in bikes:
+                representation = serializer.to_representation(bike)
+                # skip bikes without data e.g. without public geolocation
+                if representation is None:
+                    continue
+                chunk.append(separator)
+                chunk.append(dumps(representation))
+                separator = b","
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    yield b"".join(chunk)
+                    chunk = []
+            chunk.append(b"]")
+            chunk.append(tail)
+            yield b"".join(chunk)
+
+        return StreamingHttpResponse(render(), content_type="application/json")
 
 
 @permission_classes([AllowAny])
@@ -102,11 +122,12 @@ class GbfsStationInformationViewSet(mixins.ListModelMixin, generics.GenericAPIVi
     serializer_class = GbfsStationInformationSerializer
 
     def get(self, request, *args, **kwargs):
+        return gbfsResponse(request, "station_information")
+
+    def get_data(self):
         stations = Station.objects.all()
         serializer = GbfsStationInformationSerializer(stations, many=True)
-        station_data = {"stations": serializer.data}
-        data = getGbfsWithData(station_data)
-        return JsonResponse(data, safe=False)
+        return {"stations": serializer.data}
 
 
 @permission_classes([AllowAny])
@@ -115,11 +136,12 @@ class GbfsVehicleTypeViewSet(mixins.ListModelMixin, generics.GenericAPIView):
     serializer_class = GbfsVehicleTypeSerializer
 
     def get(self, request, *args, **kwargs):
+        return gbfsResponse(request, "vehicle_types")
+
+    def get_data(self):
         vehicle_types = VehicleType.objects.all()
         serializer = GbfsVehicleTypeSerializer(vehicle_types, many=True)
-        vehicle_type_data = {"vehicle_types": serializer.data}
-        data = getGbfsWithData(vehicle_type_data)
-        return JsonResponse(data, safe=False)
+        return {"vehicle_types": serializer.data}
 
 
 @permission_classes([AllowAny])
@@ -128,21 +150,93 @@ class GbfsStationStatusViewSet(mixins.ListModelMixin, generics.GenericAPIView):
     serializer_class = GbfsStationStatusSerializer
 
     def get(self, request, *args, **kwargs):
+        return gbfsResponse(request, "station_status")
+
+    def get_data(self):
+        bsp = preferences.BikeSharePreferences
         stations = Station.objects.filter(status=Station.Status.ACTIVE)
-        serializer = GbfsStationStatusSerializer(stations, many=True)
-        station_data = {"stations": serializer.data}
-        data = getGbfsWithData(station_data)
-        return JsonResponse(data, safe=False)
+        bikes = filterAvailableBikes(bsp).filter(
+            current_station__status=Station.Status.ACTIVE
+        )
+        bikes = bikes.select_related("vehicle_type", "last_public_location")
+        # group the bikes by station, so the serializer doesn't need to
+        # query the bikes of every station on its own
+        vehicles = defaultdict(list)
+        for bike in bikes:
+            vehicles[bike.current_station_id].append(bike)
+        serializer = GbfsStationStatusSerializer(
+            stations, many=True, context={"vehicles": vehicles}
+        )
+        return {"stations": serializer.data}
+
+
+FEED_VIEWS = {
+    "station_information": GbfsStationInformationViewSet,
+    "station_status": GbfsStationStatusViewSet,
+    "free_bike_status": GbfsFreeBikeStatusViewSet,
+    "vehicle_types": GbfsVehicleTypeViewSet,
+}
+
+
+def getFeedBuilder(feed, root):
+    """return the function building the data of a feed, and the variant of
+    its snapshot.
+
+    `root` is the url the feeds are published at.
+    """
+    if feed == "gbfs":
+        return partial(gbfsData, root), root + languageCode()
+    if feed == "system_information":
+        return systemInformationData, languageCode()
+    return FEED_VIEWS[feed]().get_data, ""
+
+
+def gbfsResponse(request, feed):
+    build, variant = getFeedBuilder(feed, getGbfsRoot(request))
+    encoding = accepted_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    # answer conditional requests from the snapshot info, before
+    # loading or building the whole snapshot
+    info = get_snapshot_info(feed, variant=variant, encoding=encoding)
+    if info is not None:
+        response = get_conditional_response(
+            request, etag=info.etag, last_modified=int(info.built_at)
+        )
+        if response is not None:
+            return withSnapshotHeaders(response, info)
+
+    snapshot = get_snapshot(feed, build, variant=variant, encoding=encoding)
+    response = HttpResponse(snapshot.body, content_type="application/json")
+    if encoding is not None:
+        response["Content-Encoding"] = encoding
+    return withSnapshotHeaders(response, snapshot)
+
+
+def withSnapshotHeaders(response, snapshot):
+    response["ETag"] = snapshot.etag
+    response["Last-Modified"] = http_date(snapshot.built_at)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def filterAvailableBikes(bsp):
+    bikes = Bike.objects.filter(availability_status=Bike.Availability.AVAILABLE)
+    # if configured filter vehicles, where time report
+    # is older than configure allowed silent timeperiod
+    if bsp.gbfs_hide_bikes_after_location_report_silence:
+        bikes = bikes.filter(
+            last_reported__gte=now()
+            - timedelta(hours=bsp.gbfs_hide_bikes_after_location_report_hours)
+        )
+    return bikes
 
 
 def getGbfsRoot(request):
+    # feeds exported as static files are published at their own url
+    if settings.GBFS_EXPORT_URL:
+        return settings.GBFS_EXPORT_URL
     return request.scheme + "://" + request.get_host() + "/gbfs/"
 
 
-def getGbfsWithData(data):
-    return {"ttl": 0, "last_updated": int(time.time()), "data": data, "version": "2.1"}
-
-
 def languageCode():
     """gbfs requires that local part of the language code (using IETF BCP 47)
     is uppercased.
@@ -1,3 +1,9 @@
+import gzip
+import json
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
 import pytest
 from django.contrib.gis.geos import Point
 from django.utils import translation
@@ -6,6 +12,8 @@ from preferences import preferences
 from rest_framework.test import APIClient
 
 from bikesharing.models import Bike, Location, LocationTracker, Station, VehicleType
+from gbfs import snapshot
+from gbfs.export import export_feeds
 from gbfs.views import languageCode
 
 
@@ -185,3 +193,391 @@ def test_gbfs_free_bike_status(available_bike, location_of_available_bike):
     assert len(response.json()["data"]["bikes"]) == 1
     gbfsbike = response.json()["data"]["bikes"][0]
     assert gbfsbike["bike_id"] == str(available_bike.non_static_bike_uuid)
+
+
+@pytest.mark.django_db
+def test_gbfs_free_bike_status_query_count(
+    django_assert_max_num_queries, vehicle_type_ebike
+):
+    for number in range(20):
+        bike = Bike.objects.create(
+            availability_status=Bike.Availability.AVAILABLE,
+            bike_number=str(number),
+            vehicle_type=vehicle_type_ebike,
+            last_reported=now(),
+        )
+        Location.objects.create(
+            bike=bike,
+            source=Location.Source.TRACKER,
+            reported_at=now(),
+            geo=Point(9.95000, 48.35000 + number / 1000, srid=4326),
+        )
+    # warm up preferences, so only the feed queries are counted
+    preferences.BikeSharePreferences
+
+    client = APIClient()
+    with django_assert_max_num_queries(5):
+        response = client.get("/gbfs/free_bike_status.json")
+    assert response.status_code == 200
+    bikes = response.json()["data"]["bikes"]
+    assert len(bikes) == 20
+    assert all(bike["vehicle_type_id"] == str(vehicle_type_ebike.id) for bike in bikes)
+    assert sorted(bike["lat"] for bike in bikes) == [
+        48.35000 + number / 1000 for number in range(20)
+    ]
+
+
+@pytest.mark.django_db
+def test_gbfs_free_bike_status_uses_latest_public_location(
+    available_bike, tracker, vehicle_type_tandem
+):
+    available_bike.vehicle_type = vehicle_type_tandem
+    available_bike.save()
+    Location.objects.create(
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now() - timedelta(minutes=5),
+        geo=Point(9.95000, 48.35000, srid=4326),
+    )
+    Location.objects.create(
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now(),
+        geo=Point(9.96000, 48.36000, srid=4326),
+    )
+    Location.objects.create(
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now() + timedelta(minutes=5),
+        internal=True,
+        geo=Point(9.97000, 48.37000, srid=4326),
+    )
+
+    client = APIClient()
+    response = client.get("/gbfs/free_bike_status.json")
+    assert response.status_code == 200
+    gbfsbike = response.json()["data"]["bikes"][0]
+    assert gbfsbike["lat"] == 48.36000
+    assert gbfsbike["lon"] == 9.96000
+    assert "current_range_meters" not in gbfsbike
+
+
+@pytest.mark.django_db
+def test_gbfs_station_status_query_count(django_assert_max_num_queries):
+    for number in range(5):
+        station = Station.objects.create(
+            status=Station.Status.ACTIVE,
+            station_name="Station {}".format(number),
+            location=Point(9.99024, 48.39662 + number / 100, srid=4326),
+            max_bikes=5,
+        )
+        for bike_number in range(number):
+            bike = Bike.objects.create(
+                availability_status=Bike.Availability.AVAILABLE,
+                bike_number="{}-{}".format(number, bike_number),
+                current_station=station,
+                last_reported=now(),
+            )
+            Location.objects.create(
+                bike=bike,
+                source=Location.Source.TRACKER,
+                reported_at=now(),
+                geo=station.location,
+            )
+    # warm up preferences, so only the feed queries are counted
+    preferences.BikeSharePreferences
+
+    client = APIClient()
+    with django_assert_max_num_queries(5):
+        response = client.get("/gbfs/station_status.json")
+    assert response.status_code == 200
+    gbfsstations = response.json()["data"]["stations"]
+    assert len(gbfsstations) == 5
+    available = sorted(station["num_bikes_available"] for station in gbfsstations)
+    assert available == list(range(5))
+    for gbfsstation in gbfsstations:
+        assert len(gbfsstation["vehicles"]) == gbfsstation["num_bikes_available"]
+        assert gbfsstation["num_docks_available"] == (
+            5 - gbfsstation["num_bikes_available"]
+        )
+
+
+@pytest.fixture
+def frozen_time(monkeypatch):
+    # the ttl in the body of a snapshot counts down every second, so only
+    # bodies rendered in the same second are identical
+    frozen = time.time()
+    monkeypatch.setattr(snapshot, "time", SimpleNamespace(time=lambda: frozen))
+
+
+@pytest.mark.django_db
+def test_gbfs_snapshot_is_served_without_queries(
+    active_station, django_assert_num_queries, frozen_time
+):
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    assert response.status_code == 200
+    with django_assert_num_queries(0):
+        cached_response = client.get("/gbfs/station_information.json")
+    assert cached_response.status_code == 200
+    assert cached_response.content == response.content
+
+
+@pytest.mark.django_db
+def test_gbfs_snapshot_ttl_and_last_updated(active_station, settings):
+    settings.GBFS_SNAPSHOT_MAX_AGE = 30
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    assert response.status_code == 200
+    assert response.json()["ttl"] == 30
+    cached_response = client.get("/gbfs/station_information.json")
+    assert cached_response.json()["last_updated"] == response.json()["last_updated"]
+
+
+@pytest.mark.django_db
+def test_gbfs_snapshot_ttl_is_remaining_lifetime(active_station, settings, monkeypatch):
+    settings.GBFS_SNAPSHOT_MAX_AGE = 30
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    last_updated = response.json()["last_updated"]
+    built_at = snapshot.get_snapshot_info("station_information").built_at
+
+    monkeypatch.setattr(snapshot, "time", SimpleNamespace(time=lambda: built_at + 10))
+    response = client.get("/gbfs/station_information.json")
+    assert response.json()["ttl"] == 20
+    assert response.json()["last_updated"] == last_updated
+    gzip_response = client.get(
+        "/gbfs/station_information.json", HTTP_ACCEPT_ENCODING="gzip"
+    )
+    assert json.loads(gzip.decompress(gzip_response.content))["ttl"] == 20
+
+    monkeypatch.setattr(snapshot, "time", SimpleNamespace(time=lambda: built_at + 29.5))
+    response = client.get("/gbfs/station_information.json")
+    assert response.json()["ttl"] == 1
+    assert response.json()["last_updated"] == last_updated
+
+
+@pytest.mark.django_db
+def test_gbfs_snapshot_invalidated_by_station_change(active_station):
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    assert len(response.json()["data"]["stations"]) == 1
+
+    active_station.station_name = "Station McStationface II"
+    active_station.save()
+    response = client.get("/gbfs/station_information.json")
+    gbfsstation = response.json()["data"]["stations"][0]
+    assert gbfsstation["name"] == "Station McStationface II"
+
+
+@pytest.mark.django_db
+def test_gbfs_snapshot_invalidated_by_location_change(
+    available_bike, location_of_available_bike
+):
+    client = APIClient()
+    response = client.get("/gbfs/free_bike_status.json")
+    assert response.json()["data"]["bikes"][0]["lat"] == 48.35000
+
+    Location.objects.create(
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now(),
+        geo=Point(9.96000, 48.36000, srid=4326),
+    )
+    response = client.get("/gbfs/free_bike_status.json")
+    assert response.json()["data"]["bikes"][0]["lat"] == 48.36000
+
+
+@pytest.mark.django_db
+def test_gbfs_snapshot_expires_after_max_age(active_station, settings):
+    settings.GBFS_SNAPSHOT_MAX_AGE = 0
+    client = APIClient()
+    client.get("/gbfs/station_information.json")
+    # bypass the signals, so only the max age can expire the snapshot
+    Station.objects.filter(pk=active_station.pk).update(station_name="Renamed")
+    response = client.get("/gbfs/station_information.json")
+    assert response.json()["ttl"] == 0
+    assert response.json()["data"]["stations"][0]["name"] == "Renamed"
+
+
+@pytest.mark.django_db
+def test_gbfs_conditional_get_with_etag(active_station, django_assert_num_queries):
+    client = APIClient()
+    response = client.get("/gbfs/station_status.json")
+    assert response.status_code == 200
+    etag = response["ETag"]
+    # weak, as the ttl in the body counts down: the bodies of a snapshot are
+    # not byte-identical, only their data is
+    assert etag.startswith('W/"')
+
+    with django_assert_num_queries(0):
+        response = client.get("/gbfs/station_status.json", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response["ETag"] == etag
+
+
+@pytest.mark.django_db
+def test_gbfs_conditional_get_with_last_modified(active_station):
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    assert response.status_code == 200
+    last_modified = response["Last-Modified"]
+
+    response = client.get(
+        "/gbfs/station_information.json", HTTP_IF_MODIFIED_SINCE=last_modified
+    )
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_gbfs_conditional_get_after_change(active_station):
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    etag = response["ETag"]
+
+    active_station.max_bikes = 7
+    active_station.save()
+    response = client.get("/gbfs/station_information.json", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert response.json()["data"]["stations"][0]["capacity"] == 7
+
+
+@pytest.mark.django_db
+def test_gbfs_gzip_encoding(active_station, frozen_time):
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    assert "Content-Encoding" not in response
+    assert "Accept-Encoding" in response["Vary"]
+
+    gzip_response = client.get(
+        "/gbfs/station_information.json", HTTP_ACCEPT_ENCODING="gzip, deflate"
+    )
+    assert gzip_response.status_code == 200
+    assert gzip_response["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in gzip_response["Vary"]
+    assert gzip.decompress(gzip_response.content) == response.content
+    assert gzip_response["ETag"] != response["ETag"]
+
+    response = client.get(
+        "/gbfs/station_information.json",
+        HTTP_ACCEPT_ENCODING="gzip",
+        HTTP_IF_NONE_MATCH=gzip_response["ETag"],
+    )
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "accept_encoding", ["gzip;q=0", "identity", "x-gzip", "gzip;q=0.5, identity"]
+)
+def test_gbfs_unaccepted_encoding(active_station, accept_encoding):
+    client = APIClient()
+    response = client.get(
+        "/gbfs/station_information.json", HTTP_ACCEPT_ENCODING=accept_encoding
+    )
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response
+    assert response.json()["data"]["stations"]
+
+
+@pytest.mark.django_db
+def test_gbfs_encoding_by_qvalue(active_station):
+    pytest.importorskip("brotli")
+    client = APIClient()
+    response = client.get(
+        "/gbfs/station_information.json", HTTP_ACCEPT_ENCODING="br;q=0.5, gzip"
+    )
+    assert response["Content-Encoding"] == "gzip"
+    response = client.get(
+        "/gbfs/station_information.json", HTTP_ACCEPT_ENCODING="br;q=0, gzip;q=0.1"
+    )
+    assert response["Content-Encoding"] == "gzip"
+
+
+@pytest.mark.django_db
+def test_gbfs_brotli_encoding(active_station, frozen_time):
+    brotli = pytest.importorskip("brotli")
+    client = APIClient()
+    response = client.get("/gbfs/station_information.json")
+    br_response = client.get(
+        "/gbfs/station_information.json", HTTP_ACCEPT_ENCODING="gzip, br"
+    )
+    assert br_response.status_code == 200
+    assert br_response["Content-Encoding"] == "br"
+    assert brotli.decompress(br_response.content) == response.content
+
+
+@pytest.mark.django_db
+def test_gbfs_export_matches_views(
+    tmp_path,
+    settings,
+    frozen_time,
+    active_station,
+    available_bike,
+    location_of_available_bike,
+):
+    settings.GBFS_EXPORT_URL = "https://static.example.org/gbfs/"
+    feeds = export_feeds(tmp_path)
+    assert len(feeds) == 6
+
+    client = APIClient()
+    for feed in feeds:
+        response = client.get("/gbfs/{}.json".format(feed))
+        assert response.status_code == 200
+        exported = (tmp_path / "{}.json".format(feed)).read_bytes()
+        assert exported == response.content
+        exported_gzip = (tmp_path / "{}.json.gz".format(feed)).read_bytes()
+        assert gzip.decompress(exported_gzip) == response.content
+
+    gbfs_feeds = json.loads((tmp_path / "gbfs.json").read_bytes())["data"]
+    for feed in gbfs_feeds[languageCode()]["feeds"]:
+        assert feed["url"] == "https://static.example.org/gbfs/{}.json".format(
+            feed["name"]
+        )
+        assert (tmp_path / "{}.json".format(feed["name"])).exists()
+
+
+@pytest.mark.django_db
+def test_gbfs_free_bike_status_streaming(
+    settings, vehicle_type_ebike, available_bike, location_of_available_bike
+):
+    for number in range(3):
+        bike = Bike.objects.create(
+            availability_status=Bike.Availability.AVAILABLE,
+            bike_number=str(number),
+            vehicle_type=vehicle_type_ebike,
+            last_reported=now(),
+        )
+        Location.objects.create(
+            bike=bike,
+            source=Location.Source.TRACKER,
+            reported_at=now(),
+            geo=Point(9.95000, 48.35000 + number / 1000, srid=4326),
+        )
+    # a bike without public location is left out
+    Location.objects.create(
+        bike=Bike.objects.create(
+            availability_status=Bike.Availability.AVAILABLE, bike_number="internal"
+        ),
+        source=Location.Source.TRACKER,
+        reported_at=now(),
+        internal=True,
+        geo=Point(9.95000, 48.35000, srid=4326),
+    )
+
+    client = APIClient()
+    response = client.get("/gbfs/free_bike_status.json")
+    assert not response.streaming
+
+    settings.GBFS_STREAM_FREE_BIKE_STATUS = True
+    streamed_response = client.get("/gbfs/free_bike_status.json")
+    assert streamed_response.status_code == 200
+    assert streamed_response.streaming
+    streamed = json.loads(b"".join(streamed_response.streaming_content))
+    assert streamed["version"] == "2.1"
+    assert len(streamed["data"]["bikes"]) == 4
+    assert sorted(streamed["data"]["bikes"], key=lambda bike: bike["bike_id"]) == (
+        sorted(response.json()["data"]["bikes"], key=lambda bike: bike["bike_id"])
+    )
@@ -0,0 +1,48 @@
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+from cykel import encoders
+from cykel.renderers import FastJSONRenderer
+
+
+@pytest.fixture
+def data():
+    return {
+        "datetime": datetime(2020, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        "date": datetime(2020, 5, 1).date(),
+        "duration": timedelta(minutes=90),
+        "decimal": Decimal("48.398400"),
+        "uuid": uuid.UUID("4a1c3f3e-6e4b-4a34-9f3c-2d7b7e2a6d3b"),
+        "lazy": gettext_lazy("Bike"),
+        "text": "Fahrradstraße\u2028",
+        1: [1.5, None, True],
+    }
+
+
+def test_dumps_matches_stdlib_encoder(data):
+    expected = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    assert json.loads(encoders.dumps(data)) == expected
+
+
+def test_dumps_without_orjson(data, monkeypatch):
+    monkeypatch.setattr(encoders, "orjson", None)
+    expected = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    assert json.loads(encoders.dumps(data)) == expected
+
+
+def test_renderer_matches_json_renderer(data):
+    del data[1]
+    rendered = FastJSONRenderer().render(data)
+    assert json.loads(rendered) == json.loads(JSONRenderer().render(data))
+    assert b"\\u2028" in rendered
+
+
+def test_renderer_without_data():
+    assert FastJSONRenderer().render(None) == b""
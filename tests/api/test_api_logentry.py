@@ -0,0 +1,190 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.utils.timezone import now, timedelta
+
+from api.views import newer_than, older_than
+from bikesharing.models import Bike, Location, LocationTracker, Station
+from cykel.models import CykelLogEntry
+
+
+@pytest.fixture
+def available_bike():
+    return Bike.objects.create(
+        availability_status=Bike.Availability.AVAILABLE, bike_number="1337"
+    )
+
+
+def log_forsaken(bike, window=timedelta(hours=1)):
+    CykelLogEntry.create_unless_time(
+        now() - window, content_object=bike, action_type="cykel.bike.forsaken"
+    )
+
+
+# the cache is written once the transaction is committed
+@pytest.mark.django_db(transaction=True)
+def test_create_unless_time(django_assert_num_queries, available_bike):
+    log_forsaken(available_bike)
+    assert CykelLogEntry.objects.count() == 1
+
+    # the last entry is remembered in the cache
+    with django_assert_num_queries(0):
+        log_forsaken(available_bike)
+    assert CykelLogEntry.objects.count() == 1
+
+    # other actions and objects are logged on their own
+    CykelLogEntry.create_unless_time(
+        now() - timedelta(hours=1),
+        content_object=available_bike,
+        action_type="cykel.bike.missing_reporting",
+    )
+    other_bike = Bike.objects.create(bike_number="2342")
+    log_forsaken(other_bike)
+    assert CykelLogEntry.objects.count() == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_unless_time_without_cache(django_assert_num_queries, available_bike):
+    log_forsaken(available_bike)
+    cache.clear()
+
+    # the database is asked once, and the result remembered
+    with django_assert_num_queries(1):
+        log_forsaken(available_bike)
+    with django_assert_num_queries(0):
+        log_forsaken(available_bike)
+    assert CykelLogEntry.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_unless_time_after_window(available_bike):
+    log_forsaken(available_bike)
+    # a shorter window is over
+    log_forsaken(available_bike, window=timedelta(0))
+    assert CykelLogEntry.objects.count() == 2
+
+    cache.clear()
+    log_forsaken(available_bike, window=timedelta(0))
+    assert CykelLogEntry.objects.count() == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_unless_time_rolled_back(available_bike):
+    with pytest.raises(DatabaseError):
+        with transaction.atomic():
+            log_forsaken(available_bike)
+            raise DatabaseError("rolled back")
+    assert CykelLogEntry.objects.count() == 0
+
+    # the rolled back entry isn't remembered
+    log_forsaken(available_bike)
+    assert CykelLogEntry.objects.count() == 1
+
+
+@pytest.fixture
+def large_log():
+    content_type = ContentType.objects.get_for_model(Bike)
+    action_types = [
+        "cykel.bike.forsaken",
+        "cykel.bike.missing_reporting",
+        "cykel.bike.rent.longterm",
+        "cykel.bike.tracker.battery.warning",
+    ]
+    CykelLogEntry.objects.bulk_create(
+        (
+            CykelLogEntry(
+                content_type=content_type,
+                object_id=number % 200,
+                action_type=action_types[number % len(action_types)],
+            )
+            for number in range(20000)
+        ),
+        batch_size=5000,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE {}".format(CykelLogEntry._meta.db_table))
+    return content_type
+
+
+@pytest.mark.django_db
+def test_logentry_queries_use_indexes(large_log):
+    last_entry = (
+        CykelLogEntry.objects.filter(
+            content_type=large_log,
+            object_id=42,
+            action_type="cykel.bike.rent.longterm",
+            timestamp__gte=now() - timedelta(hours=1),
+        )
+        .order_by("-timestamp")
+        .values_list("timestamp", flat=True)[:1]
+    )
+    assert "logentry_object_action_idx" in last_entry.explain()
+
+    feed_page = CykelLogEntry.objects.order_by("-timestamp", "-id")[:25]
+    assert "logentry_feed_idx" in feed_page.explain()
+
+    # the scan of a later page starts at the cursor, instead of filtering
+    # all newer entries
+    cursor = feed_page[24]
+    for entries in (
+        CykelLogEntry.objects.order_by("-timestamp", "-id").filter(
+            older_than(cursor.timestamp, cursor.pk)
+        ),
+        CykelLogEntry.objects.order_by("timestamp", "id").filter(
+            newer_than(cursor.timestamp, cursor.pk)
+        ),
+    ):
+        plan = entries[:26].explain()
+        assert "logentry_feed_idx" in plan
+        assert "Index Cond" in plan
+
+    tracker_entries = CykelLogEntry.objects.filter(data__contains={"bike_id": 42})
+    assert "logentry_data_idx" in tracker_entries.explain()
+
+
+@pytest.fixture
+def various_log(available_bike):
+    station = Station.objects.create(station_name="Marktplatz")
+    location = Location.objects.create(
+        bike=available_bike, geo=Point(9.93, 51.53, srid=4326), reported_at=now()
+    )
+    tracker = LocationTracker.objects.create(device_id="23", bike=available_bike)
+    entries = [
+        (available_bike, "cykel.bike.forsaken", {}),
+        (
+            available_bike,
+            "cykel.bike.rent.finished.station",
+            {"rent_id": 1, "station_id": station.pk},
+        ),
+        (
+            available_bike,
+            "cykel.bike.rent.started.freefloat",
+            {"rent_id": 2, "location_id": location.pk},
+        ),
+        (
+            tracker,
+            "cykel.bike.tracker.battery.warning",
+            {"voltage": 3.2, "bike_id": available_bike.pk},
+        ),
+        # referenced objects which are gone
+        (tracker, "cykel.bike.tracker.missed_checkin", {"bike_id": 4242}),
+        (available_bike, "cykel.bike.rent.started.station", {"station_id": 4242}),
+    ]
+    for content_object, action_type, data in entries:
+        CykelLogEntry.objects.create(
+            content_object=content_object, action_type=action_type, data=data
+        )
+
+
+@pytest.mark.django_db
+def test_prefetch_display(django_assert_num_queries, various_log):
+    displayed = [entry.display() for entry in CykelLogEntry.objects.all()]
+
+    entries = list(CykelLogEntry.objects.all())
+    # bikes, trackers, stations and locations
+    with django_assert_num_queries(4):
+        CykelLogEntry.prefetch_display(entries)
+    with django_assert_num_queries(0):
+        assert [entry.display() for entry in entries] == displayed
@@ -1,9 +1,22 @@
+from urllib.parse import urlencode, urlsplit
+from xml.etree import ElementTree
+
 import pytest
 from django.contrib.auth.models import Permission
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import formats
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now, template_localtime, timedelta
 from requests.auth import _basic_auth_str
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
+from bikesharing.admin import format_geolocation_text
+from bikesharing.models import Bike, Location, LocationTracker
+from cykel.models import CykelLogEntry
+
 
 @pytest.fixture
 def testuser_john_doe(django_user_model):
@@ -93,3 +106,206 @@ def test_get_map_logged_in_default_user_with_maintain_rights_basic_auth(
 ):
     response = user_client_mary_maintain_logged_in_basic.get("/api/maintenance/mapdata")
     assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_get_map_shows_last_report_of_merged_location(
+    user_client_mary_maintain_logged_in,
+):
+    bike = Bike.objects.create(bike_number="1337")
+    tracker = LocationTracker.objects.create(device_id="42", bike=bike)
+    first_reported_at = now() - timedelta(minutes=30)
+    last_reported_at = now() - timedelta(minutes=10)
+    location = Location.objects.create(
+        bike=bike,
+        tracker=tracker,
+        source=Location.Source.TRACKER,
+        geo=Point(9.99026, 48.39662, srid=4326),
+        reported_at=first_reported_at,
+        last_reported_at=last_reported_at,
+        report_count=3,
+    )
+
+    response = user_client_mary_maintain_logged_in.get("/api/maintenance/mapdata")
+    assert response.status_code == 200
+    (tracker_data,) = response.json()[0]["trackers"]
+    assert parse_datetime(tracker_data["last_location_reported"]) == last_reported_at
+
+    text = format_geolocation_text(location)
+    assert formats.localize(template_localtime(last_reported_at)) in text
+    assert formats.localize(template_localtime(first_reported_at)) not in text
+
+
+@pytest.fixture
+def log_entries():
+    bike = Bike.objects.create(bike_number="1337")
+    entries = CykelLogEntry.objects.bulk_create(
+        CykelLogEntry(content_object=bike, action_type="cykel.bike.forsaken")
+        for _ in range(60)
+    )
+    # entries of the same time are ordered by id
+    CykelLogEntry.objects.update(timestamp=now())
+    return sorted(entry.pk for entry in entries)[::-1]
+
+
+def get_feed_page(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    channel = ElementTree.fromstring(response.content).find("channel")
+    links = {
+        link.get("rel"): link.get("href")
+        for link in channel.findall("link")
+        if link.get("rel")
+    }
+    ids = [
+        int(item.findtext("link").rstrip("/").split("/")[-2])
+        for item in channel.findall("item")
+    ]
+    return ids, links
+
+
+def page_url(link):
+    url = urlsplit(link)
+    return f"{url.path}?{url.query}" if url.query else url.path
+
+
+@pytest.mark.django_db
+def test_logentryfeed_pages(user_client_mary_maintain_logged_in, log_entries):
+    client = user_client_mary_maintain_logged_in
+    with CaptureQueriesContext(connection) as queries:
+        ids, links = get_feed_page(client, "/api/maintenance/logentryfeed")
+    assert not any("COUNT(" in query["sql"] for query in queries.captured_queries)
+    assert ids == log_entries[:25]
+    assert set(links) == {"next", "last"}
+
+    ids, links = get_feed_page(client, page_url(links["next"]))
+    assert ids == log_entries[25:50]
+    assert set(links) == {"first", "previous", "next", "last"}
+
+    ids, links = get_feed_page(client, page_url(links["next"]))
+    assert ids == log_entries[50:]
+    assert set(links) == {"first", "previous"}
+
+    ids, links = get_feed_page(client, page_url(links["previous"]))
+    assert ids == log_entries[25:50]
+
+    ids, links = get_feed_page(client, page_url(links["last"]))
+    assert ids == log_entries[35:]
+    assert set(links) == {"first", "previous"}
+
+    ids, links = get_feed_page(client, page_url(links["first"]))
+    assert ids == log_entries[:25]
+
+
+@pytest.mark.django_db
+def test_logentryfeed_invalid_cursor(user_client_mary_maintain_logged_in):
+    response = user_client_mary_maintain_logged_in.get(
+        "/api/maintenance/logentryfeed?after=invalid"
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_logentryfeed_rejects_page_numbers(user_client_mary_maintain_logged_in):
+    response = user_client_mary_maintain_logged_in.get(
+        "/api/maintenance/logentryfeed?page=2"
+    )
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def filterable_log():
+    bike = Bike.objects.create(bike_number="1337")
+    other_bike = Bike.objects.create(bike_number="4242")
+    tracker = LocationTracker.objects.create(device_id="23", bike=bike)
+    entries = [
+        (bike, "cykel.bike.forsaken", {}),
+        (other_bike, "cykel.bike.forsaken", {}),
+        (tracker, "cykel.bike.tracker.battery.warning", {"bike_id": bike.pk}),
+        (tracker, "cykel.tracker.battery.warning", {}),
+        (tracker, "cykel.tracker.missing_reporting", {}),
+    ]
+    created = {}
+    for content_object, action_type, data in entries:
+        entry = CykelLogEntry.objects.create(
+            content_object=content_object, action_type=action_type, data=data
+        )
+        created.setdefault(action_type, []).append(entry.pk)
+    CykelLogEntry.objects.filter(pk=created["cykel.bike.forsaken"][0]).update(
+        timestamp=now() - timedelta(days=2)
+    )
+    return {"bike": bike, "tracker": tracker, "entries": created}
+
+
+@pytest.mark.django_db
+def test_filteredlogentryfeed(user_client_mary_maintain_logged_in, filterable_log):
+    def filtered(**params):
+        url = "/api/maintenance/filteredlogentryfeed?" + urlencode(params, True)
+        ids, links = get_feed_page(user_client_mary_maintain_logged_in, url)
+        return {
+            action_type
+            for action_type, pks in filterable_log["entries"].items()
+            for pk in pks
+            if pk in ids
+        }
+
+    assert len(filtered()) == 4
+    assert filtered(
+        action_type=["cykel.bike.tracker.battery.", "cykel.tracker.battery."]
+    ) == {
+        "cykel.bike.tracker.battery.warning",
+        "cykel.tracker.battery.warning",
+    }
+    assert filtered(
+        content_type="bikesharing.locationtracker",
+        object_id=filterable_log["tracker"].pk,
+    ) == {
+        "cykel.bike.tracker.battery.warning",
+        "cykel.tracker.battery.warning",
+        "cykel.tracker.missing_reporting",
+    }
+    assert filtered(bike=filterable_log["bike"].pk) == {
+        "cykel.bike.forsaken",
+        "cykel.bike.tracker.battery.warning",
+    }
+    since = (now() - timedelta(days=1)).isoformat()
+    assert filtered(bike=filterable_log["bike"].pk, since=since) == {
+        "cykel.bike.tracker.battery.warning",
+    }
+    assert filtered(bike=filterable_log["bike"].pk, until=since) == {
+        "cykel.bike.forsaken",
+    }
+
+
+@pytest.mark.django_db
+def test_filteredlogentryfeed_keeps_filters_in_links(
+    user_client_mary_maintain_logged_in, log_entries
+):
+    client = user_client_mary_maintain_logged_in
+    ids, links = get_feed_page(
+        client, "/api/maintenance/filteredlogentryfeed?action_type=cykel.bike."
+    )
+    assert ids == log_entries[:25]
+    assert "action_type=cykel.bike." in links["next"]
+
+    ids, links = get_feed_page(client, page_url(links["next"]))
+    assert ids == log_entries[25:50]
+    assert "action_type=cykel.bike." in links["previous"]
+
+    ids, links = get_feed_page(
+        client, "/api/maintenance/filteredlogentryfeed?action_type=cykel.tracker."
+    )
+    assert ids == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "query", ["bike=one", "since=yesterday", "content_type=bike", "object_id=x"]
+)
+def test_filteredlogentryfeed_invalid_filter(
+    user_client_mary_maintain_logged_in, query
+):
+    response = user_client_mary_maintain_logged_in.get(
+        "/api/maintenance/filteredlogentryfeed?" + query
+    )
+    assert response.status_code == 400
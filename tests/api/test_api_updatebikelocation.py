@@ -1,10 +1,32 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
 import pytest
+from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils.timezone import now
 from preferences import preferences
 from rest_framework.test import APIClient
 from rest_framework_api_key.models import APIKey
 
-from bikesharing.models import Bike, LocationTracker, Station
+from bikesharing import ingest, report_queue, station_matching, tracker_lookup
+from bikesharing.models import Bike, Location, LocationTracker, Rent, Station
+from bikesharing.report_queue import get_queue
+from bikesharing.station_matching import (
+    find_station_id,
+    find_station_ids,
+    query_station_id,
+)
+from bikesharing.tasks import ingest_tracker_reports
+from bikesharing.tracker_lookup import lookup_trackers
 
 
 # TODO: move into conftest.py
@@ -85,6 +107,24 @@ def test_tracker_updatebikelocation_updates_battery_voltage(
     assert tracker.battery_voltage == 3.45
 
 
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_invalidates_gbfs_snapshots(
+    tracker, tracker_client_with_apikey
+):
+    client = APIClient()
+    response = client.get("/gbfs/free_bike_status.json")
+    assert response.json()["data"]["bikes"] == []
+
+    data = {"device_id": tracker.device_id, "lat": 48.35, "lng": 9.95}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+
+    response = client.get("/gbfs/free_bike_status.json")
+    bikes = response.json()["data"]["bikes"]
+    assert len(bikes) == 1
+    assert bikes[0]["lat"] == 48.35
+
+
 @pytest.mark.django_db
 def test_tracker_updatebikelocation_wants_both_parts_of_a_coordinate(
     tracker, tracker_client_with_apikey
@@ -221,3 +261,710 @@ def test_tracker_updatebikelocation_keep_automatic_station_assignment_for_intern
     assert response.status_code == 200, response.content
     available_bike.refresh_from_db()
     assert available_bike.current_station == active_station
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_updates_location_pointers(
+    tracker, internal_tracker, available_bike, tracker_client_with_apikey
+):
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+    data = {"device_id": internal_tracker.device_id, "lat": 49.39662, "lng": 9.99025}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+
+    available_bike.refresh_from_db()
+    tracker.refresh_from_db()
+    internal_tracker.refresh_from_db()
+    assert available_bike.last_public_location == tracker.last_location
+    assert available_bike.last_public_location.geo.y == 48.39662
+    assert available_bike.last_internal_location == internal_tracker.last_location
+    assert available_bike.last_internal_location.geo.y == 49.39662
+
+
+@pytest.mark.django_db
+def test_location_pointers_keep_latest_location(tracker, available_bike):
+    latest = Location.objects.create(
+        tracker=tracker,
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now(),
+        geo=Point(9.99026, 48.39662, srid=4326),
+    )
+    Location.objects.create(
+        tracker=tracker,
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now() - timedelta(minutes=5),
+        geo=Point(9.99025, 49.39662, srid=4326),
+    )
+    available_bike.refresh_from_db()
+    tracker.refresh_from_db()
+    assert available_bike.public_geolocation() == latest
+    assert tracker.current_geolocation() == latest
+
+
+@pytest.mark.django_db
+def test_location_pointers_not_overwritten_by_stale_instance(available_bike):
+    stale_bike = Bike.objects.get(pk=available_bike.pk)
+    location = Location.objects.create(
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now(),
+        geo=Point(9.99026, 48.39662, srid=4326),
+    )
+    stale_bike.internal_note = "flat tire"
+    stale_bike.save()
+
+    available_bike.refresh_from_db()
+    assert available_bike.internal_note == "flat tire"
+    assert available_bike.public_geolocation() == location
+
+
+@pytest.mark.django_db
+def test_location_pointers_fall_back_when_latest_is_deleted(tracker, available_bike):
+    previous = Location.objects.create(
+        tracker=tracker,
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now() - timedelta(minutes=5),
+        geo=Point(9.99025, 49.39662, srid=4326),
+    )
+    latest = Location.objects.create(
+        tracker=tracker,
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now(),
+        geo=Point(9.99026, 48.39662, srid=4326),
+    )
+    latest.delete()
+
+    available_bike.refresh_from_db()
+    tracker.refresh_from_db()
+    assert available_bike.public_geolocation() == previous
+    assert tracker.current_geolocation() == previous
+
+    previous.delete()
+    available_bike.refresh_from_db()
+    tracker.refresh_from_db()
+    assert available_bike.public_geolocation() is None
+    assert tracker.current_geolocation() is None
+
+
+@pytest.mark.django_db
+def test_backfill_location_pointers(tracker, available_bike):
+    location = Location.objects.create(
+        tracker=tracker,
+        bike=available_bike,
+        source=Location.Source.TRACKER,
+        reported_at=now(),
+        geo=Point(9.99026, 48.39662, srid=4326),
+    )
+    Bike.objects.update(last_public_location=None)
+    LocationTracker.objects.update(last_location=None)
+
+    call_command("backfill_location_pointers")
+
+    available_bike.refresh_from_db()
+    tracker.refresh_from_db()
+    assert available_bike.public_geolocation() == location
+    assert available_bike.internal_geolocation() is None
+    assert tracker.current_geolocation() == location
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocations(
+    tracker,
+    internal_tracker,
+    available_bike,
+    active_station,
+    tracker_client_with_apikey,
+):
+    data = [
+        {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026},
+        {"device_id": internal_tracker.device_id, "battery_voltage": 3.45},
+        {"device_id": "unknown", "lat": 48.39662, "lng": 9.99026},
+        {"device_id": tracker.device_id, "lat": 1},
+        {"lat": 48.39662, "lng": 9.99026},
+    ]
+    response = tracker_client_with_apikey.post(
+        "/api/bike/updatelocations", data=data, format="json"
+    )
+    assert response.status_code == 200, response.content
+    results = response.json()
+    assert results[0] == {"success": True}
+    assert results[1] == {"success": True, "warning": "lat/lng missing"}
+    assert results[2] == {"error": "tracker does not exist"}
+    assert "error" in results[3]
+    assert results[4] == {"error": "device_id missing"}
+
+    tracker.refresh_from_db()
+    internal_tracker.refresh_from_db()
+    available_bike.refresh_from_db()
+    assert tracker.last_reported is not None
+    assert tracker.current_geolocation().geo.y == 48.39662
+    assert internal_tracker.battery_voltage == 3.45
+    assert internal_tracker.current_geolocation() is None
+    assert available_bike.public_geolocation() == tracker.current_geolocation()
+    assert available_bike.current_station == active_station
+    assert available_bike.last_reported is not None
+
+
+# queries of applying a batch of reports, independent of the number of
+# reports in it
+BATCH_QUERIES = 20
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocations_query_count(
+    django_assert_max_num_queries, tracker_client_with_apikey
+):
+    trackers = [
+        LocationTracker.objects.create(
+            device_id=number,
+            bike=Bike.objects.create(bike_number=number),
+            # bikes with internal reports only aren't matched to stations
+            internal=number % 2 == 0,
+        )
+        for number in range(40)
+    ]
+    # warm up preferences, so only the report queries are counted
+    preferences.BikeSharePreferences
+    data = [
+        {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+        for tracker in trackers
+    ]
+    with django_assert_max_num_queries(BATCH_QUERIES):
+        response = tracker_client_with_apikey.post(
+            "/api/bike/updatelocations", data=data, format="json"
+        )
+    assert response.status_code == 200, response.content
+    assert response.json() == [{"success": True}] * 40
+    assert Location.objects.filter(internal=False).count() == 20
+    assert Location.objects.filter(internal=True).count() == 20
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocations_wants_a_list(tracker, tracker_client_with_apikey):
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    response = tracker_client_with_apikey.post(
+        "/api/bike/updatelocations", data=data, format="json"
+    )
+    assert response.status_code == 400, response.content
+
+
+@pytest.fixture
+def async_ingest(settings):
+    settings.TRACKER_INGEST_ASYNC = True
+    settings.TRACKER_INGEST_QUEUE_URL = "memory://"
+    queue = get_queue()
+    queue.pop(len(queue))
+    return queue
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_async(
+    async_ingest, tracker, available_bike, active_station, tracker_client_with_apikey
+):
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 202, response.content
+    tracker.refresh_from_db()
+    assert tracker.last_reported is None
+    assert len(async_ingest) == 1
+
+    ingest_tracker_reports()
+
+    assert len(async_ingest) == 0
+    tracker.refresh_from_db()
+    available_bike.refresh_from_db()
+    assert tracker.last_reported is not None
+    assert tracker.current_geolocation().geo.y == 48.39662
+    assert available_bike.public_geolocation() == tracker.current_geolocation()
+    assert available_bike.current_station == active_station
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocations_async(
+    async_ingest, tracker, tracker_client_with_apikey
+):
+    data = [
+        {"device_id": tracker.device_id, "battery_voltage": 3.45},
+        {"device_id": "unknown", "lat": 48.39662, "lng": 9.99026},
+        {"device_id": tracker.device_id, "lat": 1},
+    ]
+    response = tracker_client_with_apikey.post(
+        "/api/bike/updatelocations", data=data, format="json"
+    )
+    assert response.status_code == 202, response.content
+    results = response.json()
+    assert results[0] == {"success": True}
+    assert results[1] == {"success": True}
+    assert "error" in results[2]
+    assert len(async_ingest) == 2
+
+    ingest_tracker_reports()
+
+    assert len(async_ingest) == 0
+    tracker.refresh_from_db()
+    assert tracker.battery_voltage == 3.45
+
+
+@pytest.mark.django_db
+def test_tracker_reports_stay_queued_on_errors(
+    monkeypatch, async_ingest, tracker, tracker_client_with_apikey
+):
+    data = [
+        {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026},
+        {"device_id": tracker.device_id, "battery_voltage": 3.45},
+    ]
+    response = tracker_client_with_apikey.post(
+        "/api/bike/updatelocations", data=data, format="json"
+    )
+    assert response.status_code == 202, response.content
+    queued = list(async_ingest.reports)
+
+    def failing_apply_reports(reports):
+        raise DatabaseError("connection lost")
+
+    monkeypatch.setattr(report_queue, "apply_reports", failing_apply_reports)
+    with pytest.raises(DatabaseError):
+        ingest_tracker_reports()
+    assert list(async_ingest.reports) == queued
+
+    monkeypatch.undo()
+    ingest_tracker_reports()
+    assert len(async_ingest) == 0
+    tracker.refresh_from_db()
+    assert tracker.battery_voltage == 3.45
+    assert tracker.current_geolocation().geo.y == 48.39662
+
+
+@pytest.fixture
+def stations_nearby():
+    # created far to near, so the lowest id is not the nearest station
+    return [
+        Station.objects.create(
+            status=Station.Status.ACTIVE,
+            station_name="Station {}".format(number),
+            location=Point(9.99024 + number * 0.0001, 48.39662, srid=4326),
+        )
+        for number in (3, 2, 1)
+    ]
+
+
+@pytest.mark.django_db
+def test_station_matching_matches_database(
+    shared_cache, stations_nearby, active_station
+):
+    Station.objects.create(
+        status=Station.Status.DISABLED,
+        station_name="Disabled Station",
+        location=Point(9.99030, 48.39662, srid=4326),
+    )
+    for dx in range(-10, 10):
+        for dy in range(-10, 10):
+            geo = Point(9.99024 + dx * 0.00005, 48.39662 + dy * 0.00005, srid=4326)
+            assert find_station_id(geo) == query_station_id(geo), geo
+
+
+@pytest.mark.django_db
+def test_station_matching_prefers_nearest_station(stations_nearby, active_station):
+    geo = Point(9.99026, 48.39662, srid=4326)
+    assert find_station_id(geo) == active_station.id
+    geo = Point(9.99034, 48.39662, srid=4326)
+    assert find_station_id(geo) == stations_nearby[2].id
+
+
+@pytest.mark.django_db
+def test_station_matching_follows_station_changes(shared_cache, active_station):
+    geo = Point(9.99025, 48.39662, srid=4326)
+    assert find_station_id(geo) == active_station.id
+    active_station.status = Station.Status.DISABLED
+    active_station.save()
+    assert find_station_id(geo) is None
+
+    bsp = preferences.BikeSharePreferences
+    bsp.station_match_max_distance = 200
+    bsp.save()
+    station = Station.objects.create(
+        status=Station.Status.ACTIVE,
+        station_name="Station 100m",
+        location=Point(9.99025, 48.39752, srid=4326),
+    )
+    assert find_station_id(geo) == station.id
+
+
+@pytest.mark.django_db
+def test_station_matching_index_expires(monkeypatch, shared_cache, active_station):
+    geo = Point(9.99025, 48.39662, srid=4326)
+    assert find_station_id(geo) == active_station.id
+
+    # a change, whose invalidation this process missed
+    Station.objects.update(status=Station.Status.DISABLED)
+    assert find_station_id(geo) == active_station.id
+
+    later = time.monotonic() + station_matching.INDEX_TIMEOUT + 1
+    monkeypatch.setattr(
+        station_matching, "time", SimpleNamespace(monotonic=lambda: later)
+    )
+    assert find_station_id(geo) is None
+
+
+@pytest.mark.django_db
+def test_station_matching_without_shared_cache(active_station):
+    geo = Point(9.99025, 48.39662, srid=4326)
+    assert find_station_id(geo) == active_station.id
+
+    # another process wouldn't see the invalidation in the local cache
+    Station.objects.update(status=Station.Status.DISABLED)
+    assert find_station_id(geo) is None
+
+
+@pytest.mark.django_db
+def test_station_matching_many_points(stations_nearby, active_station):
+    points = [
+        (9.99024 + dx * 0.00005, 48.39662 + dy * 0.00005)
+        for dx in range(-10, 10)
+        for dy in range(-10, 10)
+    ]
+    expected = [find_station_id(Point(lon, lat, srid=4326)) for lon, lat in points]
+    assert find_station_ids(points) == expected
+    assert find_station_ids([]) == []
+
+
+@pytest.fixture
+def location_dedup():
+    bsp = preferences.BikeSharePreferences
+    bsp.location_dedup = True
+    bsp.location_dedup_distance = 10
+    bsp.save()
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_dedup(
+    location_dedup, tracker, available_bike, tracker_client_with_apikey
+):
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+    tracker.refresh_from_db()
+    first = tracker.current_geolocation()
+
+    # about 5m away
+    data = {"device_id": tracker.device_id, "lat": 48.39666, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+    assert Location.objects.filter(tracker=tracker).count() == 1
+    available_bike.refresh_from_db()
+    location = available_bike.public_geolocation()
+    assert location == first
+    assert location.geo == first.geo
+    assert location.report_count == 2
+    # the location keeps the time of its first report
+    assert location.reported_at == first.reported_at
+    assert location.last_reported_at > first.reported_at
+    assert location.last_seen() == location.last_reported_at
+
+    # about 50m away
+    data = {"device_id": tracker.device_id, "lat": 48.39707, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+    assert Location.objects.filter(tracker=tracker).count() == 2
+    available_bike.refresh_from_db()
+    assert available_bike.public_geolocation().geo.y == 48.39707
+    assert available_bike.public_geolocation().report_count == 1
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_dedup_points_at_last_seen_location(
+    location_dedup, tracker, available_bike, tracker_client_with_apikey
+):
+    merged = Location.objects.create(
+        bike=available_bike,
+        tracker=tracker,
+        source=Location.Source.TRACKER,
+        reported_at=now() - timedelta(minutes=10),
+        geo=Point(9.99026, 48.39662, srid=4326),
+    )
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+
+    # reported before the last, but after the first report at `merged`
+    Location.objects.create(
+        bike=available_bike,
+        source=Location.Source.LOCK,
+        reported_at=now() - timedelta(minutes=5),
+        geo=Point(9.99, 48.4, srid=4326),
+    )
+    available_bike.refresh_from_db()
+    assert available_bike.public_geolocation() == merged
+
+    # the latest location of the bike is restored by the last report as well
+    Bike.objects.update(last_public_location=None)
+    call_command("backfill_location_pointers")
+    available_bike.refresh_from_db()
+    assert available_bike.public_geolocation() == merged
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_dedup_keeps_more_accurate_reports(
+    location_dedup, tracker, tracker_client_with_apikey
+):
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    for accuracy, locations in ((20, 1), (5, 2), (30, 2)):
+        data["accuracy"] = accuracy
+        response = tracker_client_with_apikey.post(
+            "/api/bike/updatelocation", data=data
+        )
+        assert response.status_code == 200, response.content
+        assert Location.objects.filter(tracker=tracker).count() == locations
+
+    tracker.refresh_from_db()
+    assert tracker.current_geolocation().accuracy == 5
+    assert tracker.current_geolocation().report_count == 2
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_dedup_counts_concurrent_reports(
+    location_dedup, tracker, tracker_client_with_apikey, monkeypatch
+):
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+    tracker.refresh_from_db()
+    location = tracker.current_geolocation()
+
+    # another worker merges reports after this one loaded the location
+    stale = Location.objects.get(pk=location.pk)
+    monkeypatch.setattr(
+        ingest, "mergeable_locations", lambda trackers: {tracker.pk: stale}
+    )
+    Location.objects.filter(pk=location.pk).update(report_count=5)
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+
+    location.refresh_from_db()
+    assert location.report_count == 6
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_dedup_keeps_rent_locations(
+    location_dedup, tracker, available_bike, tracker_client_with_apikey
+):
+    data = {"device_id": tracker.device_id, "lat": 48.39662, "lng": 9.99026}
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+    tracker.refresh_from_db()
+    Rent.objects.create(
+        bike=available_bike,
+        user=get_user_model().objects.create(username="jane"),
+        rent_start=now(),
+        start_location=tracker.current_geolocation(),
+    )
+
+    response = tracker_client_with_apikey.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 200, response.content
+    assert Location.objects.filter(tracker=tracker).count() == 2
+
+
+@pytest.mark.django_db
+def test_tracker_lookup_from_cache(
+    django_assert_num_queries, shared_cache, tracker, internal_tracker
+):
+    device_ids = [tracker.device_id, internal_tracker.device_id, "unknown"]
+    trackers = lookup_trackers(device_ids)
+    assert sorted(trackers) == ["23", "42"]
+    assert trackers["42"].pk == tracker.pk
+    assert trackers["42"].bike_id == tracker.bike_id
+    assert trackers["23"].internal
+
+    with django_assert_num_queries(0):
+        assert sorted(lookup_trackers(device_ids)) == ["23", "42"]
+
+
+@pytest.mark.django_db
+def test_tracker_lookup_follows_tracker_changes(shared_cache, tracker, available_bike):
+    assert lookup_trackers(["42"])["42"].bike_id == available_bike.pk
+    assert lookup_trackers(["7"]) == {}
+
+    tracker.bike = None
+    tracker.save()
+    new_tracker = LocationTracker.objects.create(device_id="7")
+
+    assert lookup_trackers(["42"])["42"].bike_id is None
+    assert lookup_trackers(["7"])["7"].pk == new_tracker.pk
+
+
+@pytest.mark.django_db
+def test_tracker_lookup_expires_locally(
+    monkeypatch, shared_cache, tracker, available_bike
+):
+    assert lookup_trackers(["42"])["42"].bike_id == available_bike.pk
+
+    # a change, whose invalidation this process missed
+    LocationTracker.objects.filter(pk=tracker.pk).update(bike=None)
+    cache.delete(tracker_lookup._key(tracker_lookup._version(), "42"))
+    assert lookup_trackers(["42"])["42"].bike_id == available_bike.pk
+
+    later = time.monotonic() + tracker_lookup.LOCAL_TIMEOUT + 1
+    monkeypatch.setattr(
+        tracker_lookup, "time", SimpleNamespace(monotonic=lambda: later)
+    )
+    assert lookup_trackers(["42"])["42"].bike_id is None
+
+
+@pytest.mark.django_db
+def test_tracker_lookup_without_shared_cache(
+    django_assert_num_queries, tracker, available_bike
+):
+    assert lookup_trackers(["42"])["42"].bike_id == available_bike.pk
+
+    # another process wouldn't see the invalidation in the local cache
+    LocationTracker.objects.filter(pk=tracker.pk).update(bike=None)
+    with django_assert_num_queries(1):
+        assert lookup_trackers(["42"])["42"].bike_id is None
+
+
+@pytest.mark.django_db
+def test_tracker_device_id_is_unique(tracker):
+    duplicate = LocationTracker(device_id=tracker.device_id)
+    with pytest.raises(ValidationError):
+        duplicate.full_clean()
+    with pytest.raises(IntegrityError):
+        with transaction.atomic():
+            duplicate.save()
+
+    # trackers without device id are allowed
+    LocationTracker.objects.create(device_id="")
+    LocationTracker.objects.create(device_id="")
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_verifies_apikey_once(monkeypatch, tracker):
+    verified = []
+    is_valid = APIKey.is_valid
+
+    def counting_is_valid(self, key):
+        verified.append(key)
+        return is_valid(self, key)
+
+    monkeypatch.setattr(APIKey, "is_valid", counting_is_valid)
+    api_key, key = APIKey.objects.create_key(name="test-tracker")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION="Api-Key " + key)
+    data = {"device_id": tracker.device_id}
+
+    for _ in range(3):
+        response = client.post("/api/bike/updatelocation", data=data)
+        assert response.status_code == 200, response.content
+    assert verified == [key]
+
+    # a wrong key with the same prefix is still checked
+    wrong_client = APIClient()
+    wrong_key = key[:-1] + ("y" if key.endswith("x") else "x")
+    wrong_client.credentials(HTTP_AUTHORIZATION="Api-Key " + wrong_key)
+    response = wrong_client.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 401
+
+    api_key.revoked = True
+    api_key.save()
+    response = client.post("/api/bike/updatelocation", data=data)
+    assert response.status_code == 401
+
+
+@pytest.fixture
+def signing_tracker(shared_cache, available_bike):
+    return LocationTracker.objects.create(
+        device_id="aa:bb:cc", bike=available_bike, hmac_secret="s3cret"
+    )
+
+
+def signed_post(path, body, device_id, secret, timestamp=None):
+    if timestamp is None:
+        timestamp = int(time.time())
+    body = json.dumps(body).encode()
+    signature = hmac.new(
+        secret.encode(), str(timestamp).encode() + b"." + body, hashlib.sha256
+    ).hexdigest()
+    return APIClient().post(
+        path,
+        data=body,
+        content_type="application/json",
+        HTTP_AUTHORIZATION="HMAC {}:{}:{}".format(device_id, timestamp, signature),
+    )
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_signed(signing_tracker):
+    data = {"device_id": "aa:bb:cc", "lat": 48.39662, "lng": 9.99026}
+    response = signed_post("/api/bike/updatelocation", data, "aa:bb:cc", "s3cret")
+    assert response.status_code == 200, response.content
+    signing_tracker.refresh_from_db()
+    assert signing_tracker.current_geolocation() is not None
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_signature_is_checked(signing_tracker, tracker):
+    data = {"device_id": "aa:bb:cc"}
+    path = "/api/bike/updatelocation"
+    assert signed_post(path, data, "aa:bb:cc", "wrong").status_code == 401
+    assert signed_post(path, data, "unknown", "s3cret").status_code == 401
+    expired = int(time.time()) - 3600
+    response = signed_post(path, data, "aa:bb:cc", "s3cret", timestamp=expired)
+    assert response.status_code == 401
+
+    # trackers without secret can't sign
+    response = signed_post(path, {"device_id": "42"}, "42", "")
+    assert response.status_code == 401
+
+    # trackers can only report for themselves
+    response = signed_post(path, {"device_id": "42"}, "aa:bb:cc", "s3cret")
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_signature_replay(signing_tracker):
+    timestamp = int(time.time())
+    data = {"device_id": "aa:bb:cc"}
+    path = "/api/bike/updatelocation"
+    response = signed_post(path, data, "aa:bb:cc", "s3cret", timestamp=timestamp)
+    assert response.status_code == 200, response.content
+    response = signed_post(path, data, "aa:bb:cc", "s3cret", timestamp=timestamp)
+    assert response.status_code == 401
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_signature_revoked(signing_tracker):
+    data = {"device_id": "aa:bb:cc"}
+    path = "/api/bike/updatelocation"
+    assert signed_post(path, data, "aa:bb:cc", "s3cret").status_code == 200
+
+    signing_tracker.hmac_secret = ""
+    signing_tracker.save()
+    assert signed_post(path, data, "aa:bb:cc", "s3cret").status_code == 401
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocation_signature_needs_shared_cache(available_bike):
+    LocationTracker.objects.create(
+        device_id="aa:bb:cc", bike=available_bike, hmac_secret="s3cret"
+    )
+    # replays to other processes would go unnoticed
+    response = signed_post(
+        "/api/bike/updatelocation", {"device_id": "aa:bb:cc"}, "aa:bb:cc", "s3cret"
+    )
+    assert response.status_code == 401
+
+
+@pytest.mark.django_db
+def test_tracker_updatebikelocations_signed(signing_tracker, tracker):
+    data = [{"device_id": "aa:bb:cc"}, {"device_id": "42"}]
+    response = signed_post("/api/bike/updatelocations", data, "aa:bb:cc", "s3cret")
+    assert response.status_code == 200, response.content
+    assert response.json() == [
+        {"success": True, "warning": "lat/lng missing"},
+        {"error": "signed by another tracker"},
+    ]
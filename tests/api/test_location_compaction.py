@@ -0,0 +1,103 @@
+import pytest
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.utils.timezone import now, timedelta
+
+from bikesharing.compaction import compact_locations, simplify
+from bikesharing.models import Bike, Location, Rent
+from gbfs.snapshot import feed_version
+
+
+@pytest.fixture
+def testuser_john_doe(django_user_model):
+    return django_user_model.objects.create(username="john", password="doe")
+
+
+@pytest.fixture
+def available_bike():
+    return Bike.objects.create(
+        availability_status=Bike.Availability.AVAILABLE, bike_number="1337"
+    )
+
+
+@pytest.fixture
+def old_track(available_bike):
+    """an L-shaped track of nine locations, 40 days old: four steps of about
+    22 meters to the east, then four to the north."""
+    start = now() - timedelta(days=40)
+    coordinates = [(9.97 + 0.0003 * i, 48.39) for i in range(5)]
+    coordinates += [(9.9712, 48.39 + 0.0002 * i) for i in range(1, 5)]
+    return [
+        Location.objects.create(
+            bike=available_bike,
+            source=Location.Source.USER,
+            reported_at=start + timedelta(minutes=i),
+            geo=Point(lon, lat, srid=4326),
+        )
+        for i, (lon, lat) in enumerate(coordinates)
+    ]
+
+
+def test_simplify():
+    line = [(0, 0), (1, 0.1), (2, -0.1), (3, 5), (4, 6), (5, 7)]
+    assert simplify(line, 1) == [0, 2, 3, 5]
+    assert simplify(line, 10) == [0, 5]
+    assert simplify(line, 10, keep=[1]) == [0, 1, 5]
+    assert simplify([(0, 0)], 1) == [0]
+    assert simplify([], 1) == []
+
+
+@pytest.mark.django_db
+def test_compact_locations(testuser_john_doe, available_bike, old_track):
+    Rent.objects.create(
+        rent_start=old_track[2].reported_at,
+        start_location=old_track[2],
+        user=testuser_john_doe,
+        bike=available_bike,
+    )
+    recent = Location.objects.create(
+        bike=available_bike,
+        source=Location.Source.USER,
+        reported_at=now(),
+        geo=Point(9.98, 48.4, srid=4326),
+    )
+
+    removed, seconds = compact_locations(30, 5)
+
+    assert removed == 5
+    assert seconds >= 0
+    kept = [old_track[i].id for i in (0, 2, 4, 8)] + [recent.id]
+    assert sorted(Location.objects.values_list("id", flat=True)) == sorted(kept)
+
+    # the compacted locations are not looked at again
+    assert compact_locations(30, 5)[0] == 0
+
+
+@pytest.mark.django_db
+def test_compact_locations_in_chunks(old_track):
+    removed, _ = compact_locations(30, 5, chunk_size=3)
+
+    remaining = set(Location.objects.values_list("id", flat=True))
+    assert removed == len(old_track) - len(remaining)
+    assert removed > 0
+    # the ends and the corner of the track are always kept
+    assert {old_track[i].id for i in (0, 4, 8)} <= remaining
+
+
+@pytest.mark.django_db
+def test_compact_locations_keeps_feeds_and_progress(old_track):
+    version = feed_version("free_bike_status")
+    removed, _ = compact_locations(30, 5)
+    assert removed > 0
+    # the removed locations are no latest locations, shown in the feeds
+    assert feed_version("free_bike_status") == version
+
+    # the progress is stored in the database, not only in the cache
+    cache.clear()
+    Location.objects.create(
+        bike=old_track[0].bike,
+        source=Location.Source.USER,
+        reported_at=old_track[0].reported_at,
+        geo=Point(9.9706, 48.39, srid=4326),
+    )
+    assert compact_locations(30, 5)[0] == 0
@@ -0,0 +1,129 @@
+import pytest
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.utils.timezone import now
+
+from bikesharing.models import Bike, Location, Rent
+from bikesharing.partitioning import (
+    add_months,
+    create_partitions,
+    drop_expired_partitions,
+    is_partitioned,
+    month_start,
+    partition_location_table,
+    partition_name,
+    partitions,
+    referencing_constraints,
+)
+
+
+@pytest.fixture
+def testuser_john_doe(django_user_model):
+    return django_user_model.objects.create(username="john", password="doe")
+
+
+@pytest.fixture
+def available_bike():
+    return Bike.objects.create(
+        availability_status=Bike.Availability.AVAILABLE, bike_number="1337"
+    )
+
+
+@pytest.fixture(autouse=True)
+def location_partitioning(settings):
+    settings.LOCATION_PARTITIONING = True
+
+
+@pytest.fixture
+def this_month():
+    return month_start(now())
+
+
+def create_location(bike, reported_at):
+    return Location.objects.create(
+        bike=bike,
+        source=Location.Source.USER,
+        reported_at=reported_at,
+        geo=Point(9.97, 48.39, srid=4326),
+    )
+
+
+def count_rows(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM {}".format(connection.ops.quote_name(table))
+        )
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+def test_partition_location_table(available_bike, this_month):
+    old = create_location(available_bike, add_months(this_month, -2))
+    new = create_location(available_bike, now())
+
+    assert not is_partitioned()
+    # the test database is migrated without LOCATION_PARTITIONING
+    assert referencing_constraints() != []
+    assert partition_location_table(months_ahead=1) == 4
+    assert referencing_constraints() == []
+    assert is_partitioned()
+    assert partitions() == [add_months(this_month, months) for months in (-2, -1, 0, 1)]
+
+    assert count_rows(partition_name(add_months(this_month, -2))) == 1
+    assert count_rows(partition_name(this_month)) == 1
+    assert set(Location.objects.values_list("id", flat=True)) == {old.id, new.id}
+
+    latest = create_location(available_bike, now())
+    assert latest.id > new.id
+    available_bike.refresh_from_db()
+    assert available_bike.public_geolocation() == latest
+
+
+@pytest.mark.django_db
+def test_create_partitions_moves_archived_locations(available_bike, this_month):
+    partition_location_table(months_ahead=0)
+    future = create_location(available_bike, add_months(this_month, 2))
+
+    assert create_partitions(3) == [
+        add_months(this_month, months) for months in (1, 2, 3)
+    ]
+    assert create_partitions(3) == []
+    assert count_rows(partition_name(add_months(this_month, 2))) == 1
+    assert Location.objects.get(pk=future.id).reported_at == future.reported_at
+
+
+@pytest.mark.django_db
+def test_drop_expired_partitions_keeps_referenced_locations(
+    testuser_john_doe, available_bike, this_month
+):
+    rented = create_location(available_bike, add_months(this_month, -6))
+    expired = create_location(available_bike, add_months(this_month, -6))
+    kept = create_location(available_bike, add_months(this_month, -1))
+    Rent.objects.create(
+        rent_start=rented.reported_at,
+        start_location=rented,
+        user=testuser_john_doe,
+        bike=available_bike,
+    )
+    partition_location_table(months_ahead=0)
+
+    dropped = drop_expired_partitions(3)
+
+    assert dropped == [add_months(this_month, months) for months in (-6, -5, -4)]
+    assert partitions() == [
+        add_months(this_month, months) for months in (-3, -2, -1, 0)
+    ]
+    assert Location.objects.filter(pk=rented.id).exists()
+    assert not Location.objects.filter(pk=expired.id).exists()
+    assert Location.objects.filter(pk=kept.id).exists()
+    assert count_rows("bikesharing_location_archive") == 1
+
+
+@pytest.mark.django_db
+def test_partition_location_table_needs_setting(settings):
+    settings.LOCATION_PARTITIONING = False
+    with pytest.raises(RuntimeError, match="LOCATION_PARTITIONING"):
+        partition_location_table()
+    assert not is_partitioned()
+    # unpartitioned installs keep the constraints
+    assert referencing_constraints() != []
@@ -0,0 +1,19 @@
+import pytest
+from django.core.cache import cache
+
+import cykel.cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # the cache is not rolled back with the database between tests
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    # the local memory cache of the tests is only used by this process,
+    # so it is as good as a shared cache
+    monkeypatch.setattr(cykel.cache, "LOCAL_BACKENDS", ())